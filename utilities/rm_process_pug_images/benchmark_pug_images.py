@@ -0,0 +1,459 @@
+"""
+Benchmark of rm_process_pug_images.py on synthetic PUG frames.
+
+Renders 1920x1080 frames with known coordinates in the HUD boxes (FIELDS) and runs
+the processing pipeline on them without any prompt. Reports the latency of every
+stage (decode, OCR per field, mask, JPEG encode, EXIF, thumbnail, write, KML) and
+the throughput and OCR accuracy of the whole pipeline for every combination of
+OCR mode, batch size and number of workers.
+
+Dependencies:
+- the dependencies of rm_process_pug_images.py
+
+Usage:
+1. Run the script in the directory of rm_process_pug_images.py, e.g.
+   python benchmark_pug_images.py --frames 100 --ocr-mode recognize template --batch-size 1 16 --workers 1 4
+2. The EasyOCR model is loaded from the 'model' directory, as in rm_process_pug_images.py.
+3. The frames are rendered into a temporary directory, --keep-frames keeps them.
+4. --report writes all results to a JSON file, to compare machines.
+
+"""
+import os
+import cv2
+import numpy as np
+import argparse
+import contextlib
+import collections
+import io
+import json
+import multiprocessing
+import re
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from colorama import init, Fore, Style
+
+import rm_process_pug_images as pug
+
+# Time of the first synthetic frame, the frames are one second apart
+FIRST_FRAME_TIME = datetime(2024, 6, 30, 12, 0, 0)
+
+# Stages of the per-stage benchmark, in pipeline order
+STAGES = ['decode'] + [f"ocr_{name}" for name in pug.FIELDS] + ['mask', 'jpeg_encode', 'exif', 'thumbnail', 'write', 'kml']
+
+
+def random_coordinates(rng):
+    """
+    Draw random coordinates within Switzerland as the texts of the HUD boxes.
+
+    Args:
+    - rng (numpy.random.Generator): Random number generator.
+
+    Returns:
+    - dict: Field name -> text shown in the box.
+    """
+    return {
+        'lat_dd': str(rng.integers(45, 48)),
+        'lat_mm': f"{rng.integers(0, 60):02d}",
+        'lat_ss': f"{rng.integers(0, 60):02d}",
+        'lat_dir': 'N',
+        'lon_dd': str(rng.integers(5, 11)),
+        'lon_mm': f"{rng.integers(0, 60):02d}",
+        'lon_ss': f"{rng.integers(0, 60):02d}",
+        'lon_dir': 'E',
+    }
+
+def render_frame(texts, rng):
+    """
+    Render a synthetic PUG frame: a smooth random scene with the HUD panel and
+    the coordinate texts in the boxes of FIELDS.
+
+    Args:
+    - texts (dict): Field name -> text, see random_coordinates().
+    - rng (numpy.random.Generator): Random number generator.
+
+    Returns:
+    - numpy.ndarray: 1920x1080 BGR image.
+    """
+    # Scene: coarse random colors scaled up, plus sensor noise
+    scene = rng.integers(40, 220, (27, 48, 3), dtype=np.uint8)
+    img = cv2.resize(scene, (1920, 1080), interpolation=cv2.INTER_CUBIC)
+    noise = rng.integers(-8, 9, img.shape, dtype=np.int16)
+    img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+    # Dark HUD panel behind the coordinate readout, a solid color as drawn by the
+    # camera overlay: unchanged coordinates give identical crops for the OCR cache
+    x1 = min(field['bbox'][0] for field in pug.FIELDS.values()) - 10
+    y1 = min(field['bbox'][1] for field in pug.FIELDS.values()) - 8
+    x2 = max(field['bbox'][2] for field in pug.FIELDS.values()) + 10
+    y2 = max(field['bbox'][3] for field in pug.FIELDS.values()) + 8
+    img[y1:y2, x1:x2] = 20
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    for name, text in texts.items():
+        x1, y1, x2, y2 = pug.FIELDS[name]['bbox']
+        # Text height of about 60 % of the box, at most as wide as the box
+        (width, height), _ = cv2.getTextSize(text, font, 1.0, 2)
+        scale = min(0.6 * min(y2 - y1, 31) / height, 0.85 * (x2 - x1) / width)
+        (width, height), _ = cv2.getTextSize(text, font, scale, 2)
+        origin = (x1 + (x2 - x1 - width) // 2, y1 + (min(y2 - y1, 31) + height) // 2)
+        cv2.putText(img, text, origin, font, scale, (255, 255, 255), 2, cv2.LINE_AA)
+    return img
+
+def generate_frames(frame_dir, count, seed=0, change_every=1):
+    """
+    Render synthetic frames as PNG files named like the PUG frames (iYYMMDD_HHMMSS-0.png).
+
+    Args:
+    - frame_dir (str): Directory for the PNG files.
+    - count (int): Number of frames.
+    - seed (int): Seed of the random number generator.
+    - change_every (int): Number of consecutive frames with the same coordinates.
+
+    Returns:
+    - dict: PNG file name -> field texts (ground truth).
+    """
+    os.makedirs(frame_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    truth = {}
+    texts = None
+    for index in range(count):
+        if index % max(1, change_every) == 0:
+            texts = random_coordinates(rng)
+        filename = (FIRST_FRAME_TIME + timedelta(seconds=index)).strftime("i%y%m%d_%H%M%S-0.png")
+        if not cv2.imwrite(os.path.join(frame_dir, filename), render_frame(texts, rng)):
+            raise ValueError(f"Error writing the frame {filename}.")
+        truth[filename] = texts
+    with open(os.path.join(frame_dir, "truth.json"), 'w') as file:
+        json.dump(truth, file, indent=1)
+    return truth
+
+def summarize(values):
+    """
+    Summarize latencies in seconds.
+
+    Args:
+    - values (list): Latencies in seconds.
+
+    Returns:
+    - dict: Count, mean, p50 and p95 in milliseconds.
+    """
+    return {'count': len(values), 'mean_ms': 1000 * sum(values) / len(values) if values else None,
+            'p50_ms': 1000 * pug.percentile(values, 50) if values else None,
+            'p95_ms': 1000 * pug.percentile(values, 95) if values else None}
+
+def read_field(name, img, reader, ocr_mode):
+    """
+    Read a single coordinate field of a frame the way the pipeline reads it, but
+    without batching and without the OCR cache.
+
+    Args:
+    - name (str): Field name.
+    - img (numpy.ndarray): 1920x1080 BGR image.
+    - reader (easyocr.Reader): EasyOCR reader instance.
+    - ocr_mode (str): 'recognize', 'detect' or 'template'.
+
+    Returns:
+    - tuple: (text, score, True if EasyOCR was used)
+    """
+    field = pug.FIELDS[name]
+    if ocr_mode == "detect":
+        result = pug.readtext_adaptive(pug.crop_image(img, field['bbox']), field, reader)
+        return (result[0][1], result[0][2], True) if result else ('', 0.0, True)
+    crop = cv2.cvtColor(pug.crop_image(img, field['bbox']), cv2.COLOR_BGR2GRAY)
+    if ocr_mode == "template":
+        text, score = pug.glyph_recognizer.read(crop, field['allowlist'])
+        if score >= pug.template_threshold:
+            return text, score, False
+    text, score = pug.recognize_crops_adaptive([(field['allowlist'], crop)], reader)[0]
+    return text, score, True
+
+def benchmark_stages(frame_dir, truth, output_dir, ocr_mode, kml_mode, use_ocr_service=False):
+    """
+    Time every stage of the pipeline frame by frame in the main process.
+
+    Args:
+    - frame_dir (str): Directory of the synthetic frames.
+    - truth (dict): PNG file name -> field texts, see generate_frames().
+    - output_dir (str): Directory for the JPEG files, thumbnails and KML.
+    - ocr_mode (str): 'recognize', 'detect' or 'template'.
+    - kml_mode (str): 'full', 'thumbnail' or 'kmz'.
+    - use_ocr_service (bool): Read the fields with the running OCR service.
+
+    Returns:
+    - dict: Stage timings ('stages'), correct reads per field ('field_accuracy'),
+      EasyOCR reads ('easyocr_reads') and the time to load the OCR model ('model_load_s').
+    """
+    reader = pug.create_reader(verbose=False, use_ocr_service=use_ocr_service)
+    timings = collections.defaultdict(list)
+    correct = collections.Counter()
+    easyocr_reads = 0
+    records = []
+    thumbnail_dir = os.path.join(output_dir, pug.THUMBNAIL_DIR)
+    os.makedirs(thumbnail_dir, exist_ok=True)
+
+    # Load the model before the first frame, it is not part of the OCR latency
+    start = time.perf_counter()
+    if not isinstance(reader, pug.OcrServiceClient) and (ocr_mode != "template" or not pug.glyph_recognizer.templates):
+        reader.character
+    model_load = time.perf_counter() - start
+
+    for filename, texts in truth.items():
+        image_path = os.path.join(frame_dir, filename)
+        start = time.perf_counter()
+        with open(image_path, 'rb') as file:
+            img = pug.load_image(image_path, file.read())
+        timings['decode'].append(time.perf_counter() - start)
+
+        read = {}
+        for name in pug.FIELDS:
+            start = time.perf_counter()
+            text, score, used_easyocr = read_field(name, img, reader, ocr_mode)
+            timings[f"ocr_{name}"].append(time.perf_counter() - start)
+            easyocr_reads += used_easyocr
+            read[name] = [text, float(score)]
+            correct[name] += text.strip() == texts[name]
+
+        start = time.perf_counter()
+        pug.apply_mask(img)
+        timings['mask'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        success, jpeg_buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, pug.JPEG_QUALITY])
+        jpeg_data = jpeg_buffer.tobytes()
+        timings['jpeg_encode'].append(time.perf_counter() - start)
+
+        date_part, time_part = re.match(pug.FILENAME_PATTERN, filename).groups()
+        lat = tuple(read[name][0] for name in ('lat_dd', 'lat_mm', 'lat_ss', 'lat_dir'))
+        lon = tuple(read[name][0] for name in ('lon_dd', 'lon_mm', 'lon_ss', 'lon_dir'))
+        start = time.perf_counter()
+        try:
+            jpeg_data = pug.build_exif_jpeg(jpeg_data, f"20{date_part[:2]} {date_part[2:4]} {date_part[4:6]}",
+                                            f"{time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}", lat, lon)
+        except Exception:
+            # Misread coordinates, the JPEG is written without EXIF like in the pipeline
+            pass
+        timings['exif'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        thumbnail = pug.create_thumbnail(img)
+        timings['thumbnail'].append(time.perf_counter() - start)
+
+        jpeg_name = filename.replace(".png", ".jpg")
+        start = time.perf_counter()
+        pug.write_file(os.path.join(output_dir, jpeg_name), jpeg_data)
+        pug.write_file(os.path.join(thumbnail_dir, jpeg_name), thumbnail)
+        timings['write'].append(time.perf_counter() - start)
+
+        records.append({'status': 'done', 'output': jpeg_name, 'datetime': pug.datetime_from_filename(filename),
+                        'latitude': pug.texts_to_decimal(read, 'lat'), 'longitude': pug.texts_to_decimal(read, 'lon')})
+
+    kml_file_path = os.path.join(output_dir, "pug_preview.kmz" if kml_mode == "kmz" else "pug_preview.kml")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pug.write_preview_kml(kml_file_path, records, output_dir, kml_mode)
+    # Per frame share of the KML, the file is written once for all frames
+    timings['kml'] = [(time.perf_counter() - start) / len(records)] * len(records)
+
+    return {'stages': {stage: summarize(timings[stage]) for stage in STAGES},
+            'field_accuracy': {name: correct[name] / len(truth) for name in pug.FIELDS},
+            'easyocr_reads': easyocr_reads, 'model_load_s': model_load}
+
+def benchmark_pipeline(frame_dir, truth, output_dir, mask_path, ocr_mode, batch_size, workers, glyph_path, threshold,
+                       use_ocr_cache, use_ocr_service=False, second_pass_threshold=0.90):
+    """
+    Run the batched pipeline of rm_process_pug_images.py on all frames and measure
+    its throughput and accuracy. Model loading and worker start-up are included,
+    as in a real run.
+
+    Args:
+    - frame_dir (str): Directory of the synthetic frames.
+    - truth (dict): PNG file name -> field texts, see generate_frames().
+    - output_dir (str): Empty directory for the JPEG files.
+    - mask_path (str): Path to pgu_mask.png.
+    - ocr_mode (str): 'recognize', 'detect' or 'template'.
+    - batch_size (int): Number of images per batch.
+    - workers (int): Number of worker processes.
+    - glyph_path (str): Glyph templates file of the 'template' OCR mode, it is not updated.
+    - threshold (float): Template score below which a box is read by EasyOCR.
+    - use_ocr_cache (bool): Reuse the results of crops with unchanged pixels.
+    - use_ocr_service (bool): Send the OCR to the running OCR service.
+    - second_pass_threshold (float): EasyOCR score below which a box is read a second time.
+
+    Returns:
+    - dict: Configuration, wall time, frames per second and accuracy.
+    """
+    pug.output_dir = output_dir
+    pug.mask_path = mask_path
+    pug.glyph_recognizer = pug.GlyphRecognizer(glyph_path)
+    pug.template_threshold = threshold
+    pug.escalation_threshold = second_pass_threshold
+    pug.ocr_cache = pug.OcrCache() if use_ocr_cache else None
+    pug.thumbnail_dir = None
+    pug.ocr_stats.clear()
+
+    image_paths = [os.path.join(frame_dir, filename) for filename in truth]
+    batches = collections.deque((image_paths[start:start + batch_size], {}, {})
+                                for start in range(0, len(image_paths), batch_size))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    records = []
+    stats = collections.Counter()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        processor = pug.BatchProcessor(workers, ocr_mode, (output_dir, mask_path, ocr_mode, threads, glyph_path,
+                                                           threshold, use_ocr_cache, None, False, use_ocr_service,
+                                                           second_pass_threshold),
+                                       use_ocr_service)
+        while batches or processor.in_flight:
+            while batches and processor.has_capacity():
+                processor.submit(batches.popleft())
+            for result in processor.collect(wait=True):
+                records += result['records']
+                stats.update(result['stats'])
+        processor.close()
+    wall_time = time.perf_counter() - start
+    stats.update(pug.ocr_stats)
+
+    fields_correct = 0
+    frames_correct = 0
+    for record in records:
+        texts = truth[record['input']]
+        correct = sum(record['texts'].get(name, [''])[0].strip() == texts[name] for name in pug.FIELDS)
+        fields_correct += correct
+        frames_correct += correct == len(pug.FIELDS)
+    return {'ocr_mode': ocr_mode, 'batch_size': batch_size, 'workers': workers, 'frames': len(records),
+            'wall_s': wall_time, 'fps': len(records) / wall_time if wall_time else None,
+            'field_accuracy': fields_correct / (len(pug.FIELDS) * len(records)) if records else None,
+            'frame_accuracy': frames_correct / len(records) if records else None,
+            'failed': sum(record['status'] != 'done' for record in records),
+            'ocr_stats': dict(stats)}
+
+def print_stages(result, ocr_mode):
+    """
+    Print the per-stage table of benchmark_stages().
+
+    Args:
+    - result (dict): Result of benchmark_stages().
+    - ocr_mode (str): OCR mode of the run.
+    """
+    print(f"Per-stage latency, OCR mode '{ocr_mode}' (one frame and one field at a time, "
+          f"model loaded in {result['model_load_s']:.1f} s, {result['easyocr_reads']} EasyOCR reads):")
+    print(f"  {'stage':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'per s':>9} {'accuracy':>9}")
+    total = 0
+    for stage, summary in result['stages'].items():
+        total += summary['mean_ms']
+        accuracy = result['field_accuracy'].get(stage[len("ocr_"):]) if stage.startswith("ocr_") else None
+        accuracy_text = f"{accuracy:>9.1%}" if accuracy is not None else ""
+        print(f"  {stage:<12} {summary['mean_ms']:>9.2f} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+              f"{1000 / summary['mean_ms'] if summary['mean_ms'] else float('inf'):>9.1f} {accuracy_text}")
+    print(f"  {'total':<12} {total:>9.2f} {'':>9} {'':>9} {1000 / total:>9.1f}")
+    print("")
+
+def print_pipeline(results):
+    """
+    Print the table of the benchmark_pipeline() runs.
+
+    Args:
+    - results (list): Results of benchmark_pipeline().
+    """
+    print("Pipeline throughput (model loading and worker start-up included):")
+    print(f"  {'ocr mode':<10} {'batch':>6} {'workers':>8} {'wall s':>8} {'frames/s':>9} {'fields ok':>10} {'frames ok':>10} "
+          f"{'2nd pass':>9}")
+    best = max(results, key=lambda result: result['fps'] or 0)
+    for result in results:
+        color = Fore.GREEN if result is best else ""
+        accuracy_color = Fore.RED if (result['frame_accuracy'] or 0) < 1 else ""
+        print(f"  {color}{result['ocr_mode']:<10} {result['batch_size']:>6} {result['workers']:>8} "
+              f"{result['wall_s']:>8.2f} {result['fps']:>9.2f}{Style.RESET_ALL} "
+              f"{accuracy_color}{result['field_accuracy']:>10.1%} {result['frame_accuracy']:>10.1%}{Style.RESET_ALL} "
+              f"{result['ocr_stats'].get('escalated', 0):>9}")
+    print("")
+
+def parse_arguments():
+    """
+    Parse the command line options.
+
+    Returns:
+    - argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark rm_process_pug_images.py on synthetic PUG frames.")
+    parser.add_argument("--frames", type=int, default=50, help="Number of synthetic frames (default: 50).")
+    parser.add_argument("--change-every", type=int, default=1,
+                        help="Number of consecutive frames with the same coordinates, as in a hovering "
+                             "helicopter; higher values show the effect of the OCR cache (default: 1).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic frames (default: 0).")
+    parser.add_argument("--ocr-mode", nargs="+", choices=["recognize", "detect", "template"], default=["recognize"],
+                        help="OCR modes to compare (default: recognize).")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[16], help="Batch sizes to compare (default: 16).")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="Worker counts to compare (default: 1).")
+    parser.add_argument("--kml-mode", choices=["full", "thumbnail", "kmz"], default="full",
+                        help="KML mode of the KML stage (default: full).")
+    parser.add_argument("--glyphs", default="pug_glyphs.npz",
+                        help="Glyph templates file of the 'template' OCR mode, it is only read (default: pug_glyphs.npz).")
+    parser.add_argument("--template-threshold", type=float, default=0.90,
+                        help="Template score below which a box is read by EasyOCR (default: 0.90).")
+    parser.add_argument("--escalation-threshold", type=float, default=0.90,
+                        help="EasyOCR score below which a box is read a second time, 0 disables it (default: 0.90).")
+    parser.add_argument("--no-ocr-cache", action="store_true", help="Disable the OCR cache in the pipeline runs.")
+    parser.add_argument("--ocr-service", action="store_true",
+                        help="Send the OCR to the running OCR service (rm_process_pug_images.py --serve).")
+    parser.add_argument("--mask", default="pgu_mask.png", help="Path to pgu_mask.png (default: current directory).")
+    parser.add_argument("--skip-stages", action="store_true", help="Only run the pipeline comparison.")
+    parser.add_argument("--keep-frames", help="Directory to keep the synthetic frames and truth.json in.")
+    parser.add_argument("--report", help="Write all results to this JSON file.")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    init()
+    if not os.path.exists(args.mask):
+        raise ValueError(f"Mask file not found at the specified path: {args.mask}")
+    mask_path = os.path.abspath(args.mask)
+    glyph_path = os.path.abspath(args.glyphs)
+
+    work_dir = tempfile.mkdtemp(prefix="pug_benchmark_")
+    try:
+        frame_dir = os.path.abspath(args.keep_frames) if args.keep_frames else os.path.join(work_dir, "frames")
+        print(f"Rendering {args.frames} synthetic frames to {frame_dir}")
+        truth = generate_frames(frame_dir, args.frames, args.seed, args.change_every)
+        print("")
+
+        report = {'frames': args.frames, 'change_every': args.change_every, 'cpu_count': os.cpu_count(),
+                  'stages': {}, 'pipeline': []}
+        if not args.skip_stages:
+            pug.mask_path = mask_path
+            pug.template_threshold = args.template_threshold
+            pug.escalation_threshold = args.escalation_threshold
+            for ocr_mode in args.ocr_mode:
+                pug.glyph_recognizer = pug.GlyphRecognizer(glyph_path)
+                output_dir = os.path.join(work_dir, f"stages_{ocr_mode}")
+                os.makedirs(output_dir)
+                result = benchmark_stages(frame_dir, truth, output_dir, ocr_mode, args.kml_mode, args.ocr_service)
+                report['stages'][ocr_mode] = result
+                print_stages(result, ocr_mode)
+
+        for ocr_mode in args.ocr_mode:
+            for batch_size in args.batch_size:
+                for workers in args.workers:
+                    output_dir = os.path.join(work_dir, f"pipeline_{ocr_mode}_{batch_size}_{workers}")
+                    os.makedirs(output_dir)
+                    report['pipeline'].append(benchmark_pipeline(frame_dir, truth, output_dir, mask_path, ocr_mode,
+                                                                 max(1, batch_size), max(1, workers), glyph_path,
+                                                                 args.template_threshold, not args.no_ocr_cache,
+                                                                 args.ocr_service, args.escalation_threshold))
+                    shutil.rmtree(output_dir)
+        print_pipeline(report['pipeline'])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"- Results written to {args.report}")
+
+
+if __name__ == "__main__":
+    # Needed for the process pool in the PyInstaller executable
+    multiprocessing.freeze_support()
+    main()
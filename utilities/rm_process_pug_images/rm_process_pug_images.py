@@ -5,10 +5,8 @@ Dependencies:
 - cv2 (OpenCV)
 - easyocr
 - numpy
-- PIL (Pillow)
 - datetime
 - exif
-- glob
 - re
 - pykml
 - lxml
@@ -21,21 +19,104 @@ Usage:
 4. If 'pgu_mask.png' is not found in the current directory, provide the path to it.
 5. The script will process each image, apply masks, extract EXIF data, and create a KML file with image previews and coordinates. 
 6. An error file will be generated for files which could not be georeferenced
+7. With --video the frames are read from a video file instead of PNG images
 
 """
 import os
 import cv2
-import easyocr
-from PIL import Image
-from datetime import datetime
+import numpy as np
+from datetime import datetime, timedelta, timezone
 from exif import Image as ExifImage
 from exif import DATETIME_STR_FORMAT
-import glob
 import re
 from pykml.factory import KML_ElementMaker as KML
 from lxml import etree
 import base64
 from colorama import init, Fore, Style
+import argparse
+import contextlib
+import functools
+import io
+import multiprocessing
+import multiprocessing.connection
+import collections
+import hashlib
+import json
+import time
+import zipfile
+import sys
+import tracemalloc
+import tempfile
+import threading
+import struct
+
+DIGITS = '0123456789'
+
+# Quality of the masked output JPEG files
+JPEG_QUALITY = 95
+
+# Glyph templates of the 'template' OCR mode: size of the normalized glyph images,
+# number of templates kept per character and the correlation margin to the second
+# best character needed for full confidence
+GLYPH_SIZE = 20
+GLYPH_SAMPLES = 8
+GLYPH_MARGIN = 0.1
+
+# Template score below which a box is read by EasyOCR in the 'template' OCR mode
+template_threshold = 0.90
+
+# EasyOCR score below which a box is read a second time with more expensive settings
+# (enhanced crop, or the full readtext() settings of FIELDS in the 'detect' OCR mode), 0 disables it
+escalation_threshold = 0.90
+
+# Cheap readtext() settings of the first pass in the 'detect' OCR mode
+FIRST_PASS_READTEXT = {'mag_ratio': 1}
+
+# Magnification and border of the enhanced crops of the second pass
+ESCALATION_MAG_RATIO = 3
+ESCALATION_BORDER = 4
+
+# File names of the PUG frames: iYYMMDD_HHMMSS-N.png
+FILENAME_PATTERN = r'i(\d{6})_(\d{6})-\d+\.png'
+
+# Mean grey value difference of a coordinate box above which a video frame counts as
+# changed in the 'changed' sampling of --video, lower differences are compression noise
+HUD_CHANGE_THRESHOLD = 6.0
+
+# Start of the time stamps in MP4/MOV headers
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+
+# Run manifest in the output directory, used to resume interrupted runs
+MANIFEST_NAME = "pug_manifest.jsonl"
+
+# Preview thumbnails of the KML modes 'thumbnail' and 'kmz', stored in the THUMBNAIL_DIR
+# subdirectory of the output directory. thumbnail_dir is set in main() if they are written.
+THUMBNAIL_DIR = "thumbs"
+THUMBNAIL_WIDTH = 400
+THUMBNAIL_QUALITY = 80
+thumbnail_dir = None
+
+# Address and key of the running OCR service (--serve), readable by the current user only
+OCR_SERVICE_FILE = os.path.join(tempfile.gettempdir(), "pug_ocr_service.json")
+
+# Counters of the OCR stages (template matches, EasyOCR fallbacks, ...) for the run summary
+ocr_stats = collections.Counter()
+
+# Stage timings of the frames processed in this process, see StageTimer and MetricsLog
+frame_metrics = []
+
+# Coordinate readout of the 1920x1080 PUG frames: bounding box (x1, y1, x2, y2),
+# allowed characters and the readtext() settings used in the 'detect' OCR mode
+FIELDS = {
+    'lat_dd': {'bbox': (1670, 988, 1725, 1017), 'allowlist': DIGITS, 'readtext': {'mag_ratio': 3, 'text_threshold': 0.6}},
+    'lat_mm': {'bbox': (1744, 988, 1799, 1017), 'allowlist': DIGITS, 'readtext': {'mag_ratio': 3, 'text_threshold': 0.6}},
+    'lat_ss': {'bbox': (1820, 988, 1867, 1017), 'allowlist': DIGITS, 'readtext': {'mag_ratio': 3, 'text_threshold': 0.6}},
+    'lat_dir': {'bbox': (1866, 988, 1891, 1017), 'allowlist': 'NS', 'readtext': {'mag_ratio': 3, 'text_threshold': 0.6}},
+    'lon_dd': {'bbox': (1670, 1018, 1730, 1060), 'allowlist': DIGITS, 'readtext': {'mag_ratio': 2}},
+    'lon_mm': {'bbox': (1744, 1018, 1799, 1049), 'allowlist': DIGITS, 'readtext': {'mag_ratio': 3, 'text_threshold': 0.6}},
+    'lon_ss': {'bbox': (1820, 1018, 1867, 1049), 'allowlist': DIGITS, 'readtext': {'mag_ratio': 3, 'text_threshold': 0.6}},
+    'lon_dir': {'bbox': (1866, 1018, 1891, 1049), 'allowlist': 'EW', 'readtext': {'mag_ratio': 3, 'text_threshold': 0.6}},
+}
 
 
 
@@ -117,15 +198,14 @@ def image_to_base64(image_path):
     with open(image_path, 'rb') as f:
         return base64.b64encode(f.read()).decode('utf-8')
 
-def extract_exif_and_create_kml(output_dir, kml_file_path):
+def create_kml_document():
     """
-    Extract EXIF data from images in the specified directory and create a KML file with image previews and coordinates.
+    Create the KML document of the preview with the image style, without placemarks.
 
-    Args:
-    - output_dir (str): Path to the directory containing processed images.
-    - kml_file_path (str): Path to save the generated KML file.
+    Returns:
+    - lxml.etree._Element: KML root element.
     """
-    kml_doc = KML.kml(
+    return KML.kml(
         KML.Document(
             KML.name("PUG-PREVIEW"),  # Set the document title here
             KML.Style(
@@ -146,144 +226,413 @@ def extract_exif_and_create_kml(output_dir, kml_file_path):
         )
     )
 
-    for filename in os.listdir(output_dir):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
-            image_path = os.path.join(output_dir, filename)
+def create_placemark(filename, lat_deg, lon_deg, exif_time, image_src):
+    """
+    Create the placemark of an image with its preview.
+
+    Args:
+    - filename (str): Name of the JPEG file.
+    - lat_deg (float): Latitude in decimal degrees.
+    - lon_deg (float): Longitude in decimal degrees.
+    - exif_time (str): Time the image was taken.
+    - image_src (str): URL of the image shown in the description, a base64 data URL
+      or a path relative to the KML file.
 
-            try:
-                with open(image_path, 'rb') as image_file:
-                    img = ExifImage(image_file)
-
-                    if img.has_exif and 'gps_latitude' in dir(img) and 'gps_longitude' in dir(img):
-                        lat = getattr(img, 'gps_latitude')
-                        lon = getattr(img, 'gps_longitude')
-                        lat_ref = getattr(img, 'gps_latitude_ref')
-                        lon_ref = getattr(img, 'gps_longitude_ref')
-
-                        lat_deg = lat[0] + lat[1] / 60 + lat[2] / 3600
-                        lon_deg = lon[0] + lon[1] / 60 + lon[2] / 3600
-
-                        if lat_ref == 'S':
-                            lat_deg = -lat_deg
-                        if lon_ref == 'W':
-                            lon_deg = -lon_deg
-
-                        # Convert image to Base64 data URL
-                        image_base64 = image_to_base64(image_path)
-
-                        # Get image creation time (adjust according to your EXIF library)
-                        exif_time = img.datetime_original
-            
-                        description = f"""
+    Returns:
+    - lxml.etree._Element: KML Placemark element.
+    """
+    description = f"""
                         File: {filename} Time: {exif_time}<br />
-                        <img src="data:image/jpeg;base64,{image_base64}" width="400px" />
+                        <img src="{image_src}" width="400px" />
                         """
 
-                        placemark = KML.Placemark(
-                            KML.name(""),  # Empty name for icon style
-                            KML.description(description),
-                            KML.styleUrl("#image_style"),
-                            KML.Point(
-                                KML.coordinates(f"{lon_deg},{lat_deg}")
-                            )
-                        )
-                        kml_doc.Document.append(placemark)
+    return KML.Placemark(
+        KML.name(""),  # Empty name for icon style
+        KML.description(description),
+        KML.styleUrl("#image_style"),
+        KML.Point(
+            KML.coordinates(f"{lon_deg},{lat_deg}")
+        )
+    )
 
-            except Exception as e:
-                print(f"Error processing {image_path}: {str(e)}")
+def without_namespace(element):
+    """
+    Remove the KML namespace from an element and its children, for writing them
+    one by one into the <kml> root. The root declares the KML namespace as default
+    namespace, written on their own the elements would repeat all its declarations.
+
+    Args:
+    - element (lxml.etree._Element): Element created with the KML factory, modified in place.
 
-    kml_tree = etree.ElementTree(kml_doc)
-    kml_tree.write(kml_file_path, pretty_print=True, xml_declaration=True, encoding="UTF-8")
-    print(f"- KML file created at {kml_file_path}")
+    Returns:
+    - lxml.etree._Element: The element.
+    """
+    for node in element.iter():
+        node.tag = etree.QName(node).localname
+    etree.cleanup_namespaces(element)
+    return element
 
+def create_thumbnail(img):
+    """
+    Encode the small JPEG preview of an image.
 
+    Args:
+    - img (numpy.ndarray): BGR image.
 
-def apply_and_save_mask(image_path):
+    Returns:
+    - bytes: JPEG data of the preview, THUMBNAIL_WIDTH pixels wide.
     """
-    Apply a mask to an image and save the masked image.
+    height, width = img.shape[:2]
+    size = (THUMBNAIL_WIDTH, max(1, round(height * THUMBNAIL_WIDTH / width)))
+    thumbnail = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    success, buffer = cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+    if not success:
+        raise ValueError("Error encoding the thumbnail as JPEG.")
+    return buffer.tobytes()
+
+def get_thumbnail_path(output_dir, filename):
+    """
+    Return the path of the thumbnail of a processed image. The thumbnail is created
+    from the JPEG if it is missing or older than the JPEG, e.g. for images processed
+    without thumbnails in an earlier run.
 
     Args:
-    - image_path (str): Path to the image file.
+    - output_dir (str): Directory of the processed JPEG files.
+    - filename (str): Name of the JPEG file.
+
+    Returns:
+    - str: Path of the thumbnail.
     """
-    # Read the input image
-    img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-    if img is None:
-        raise ValueError(f"Error loading the image {image_path}. Please check the file path.")
-    
-    # Read the mask image with alpha channel 
-    mask = cv2.imread(mask_path, cv2.IMREAD_UNCHANGED)
-    if mask is None:
-        raise ValueError(f"Error loading the mask image {mask_path}. Please check the file path.")
-    
-    # Ensure the mask size matches the image size
-    if mask.shape[:2] != img.shape[:2]:
-        raise ValueError(f"The mask size {mask.shape[:2]} does not match the image size {img.shape[:2]}.")
-    
-    # Split the mask into its color and alpha channels
-    b, g, r, alpha = cv2.split(mask)
+    jpeg_path = os.path.join(output_dir, filename)
+    thumbnail_path = os.path.join(output_dir, THUMBNAIL_DIR, filename)
+    if not os.path.exists(thumbnail_path) or os.path.getmtime(thumbnail_path) < os.path.getmtime(jpeg_path):
+        # A quarter of the resolution is still wider than the thumbnail and decodes much faster
+        img = cv2.imread(jpeg_path, cv2.IMREAD_REDUCED_COLOR_4)
+        if img is None:
+            raise ValueError(f"Error loading image {jpeg_path}.")
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        write_file(thumbnail_path, create_thumbnail(img))
+    return thumbnail_path
+
+def get_image_src(output_dir, filename, kml_mode):
+    """
+    Return the image URL of the placemark description of a processed image.
+
+    Args:
+    - output_dir (str): Directory of the processed JPEG files.
+    - filename (str): Name of the JPEG file.
+    - kml_mode (str): 'full' embeds the JPEG, 'thumbnail' embeds the thumbnail,
+      'kmz' links the thumbnail packed into the KMZ file, 'link' links the JPEG
+      and 'thumbnail_link' the thumbnail next to the KML.
+
+    Returns:
+    - str: Base64 data URL or path relative to the KML file.
+    """
+    if kml_mode == "link":
+        return filename
+    if kml_mode == "full":
+        return f"data:image/jpeg;base64,{image_to_base64(os.path.join(output_dir, filename))}"
+    thumbnail_path = get_thumbnail_path(output_dir, filename)
+    if kml_mode in ("kmz", "thumbnail_link"):
+        return f"{THUMBNAIL_DIR}/{filename}"
+    return f"data:image/jpeg;base64,{image_to_base64(thumbnail_path)}"
+
+def has_placemark(record):
+    """
+    Check if a manifest record gets a placemark in the KML preview.
+
+    Args:
+    - record (dict): Manifest record of the image, see process_batch().
+
+    Returns:
+    - bool: True if the image was processed and its coordinates are known.
+    """
+    return record['status'] == 'done' and record.get('latitude') is not None and record.get('output') is not None
+
+def stream_kml(file, records, output_dir, kml_mode="full", image_sources=None):
+    """
+    Write the KML document of the preview placemark by placemark, only one
+    placemark and its image are held in memory at a time.
 
-    # Convert the original image to BGRA if it's not already
-    if img.shape[2] == 3:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    Args:
+    - file (file-like object): Binary file the KML is written to.
+    - records (list): Manifest records with placemarks, see has_placemark().
+    - output_dir (str): Directory of the processed JPEG files.
+    - kml_mode (str): 'full', 'thumbnail' or 'kmz', see get_image_src().
+    - image_sources (dict): Optional JPEG name -> image URL cache, filled with the
+      URLs built while writing.
+
+    Returns:
+    - list: The records written as placemarks.
+    """
+    written = []
+    document = create_kml_document()
+    with etree.xmlfile(file, encoding="UTF-8") as xf:
+        xf.write_declaration()
+        with xf.element(document.tag, nsmap=document.nsmap):
+            with xf.element(document.Document.tag):
+                for child in list(document.Document.iterchildren()):
+                    # Detached from the root, which holds the namespace declarations
+                    document.Document.remove(child)
+                    xf.write(without_namespace(child), pretty_print=True)
+                for record in records:
+                    filename = record['output']
+                    image_src = image_sources.get(filename) if image_sources is not None else None
+                    try:
+                        if image_src is None:
+                            image_src = get_image_src(output_dir, filename, kml_mode)
+                    except Exception as e:
+                        print(f"Error processing {os.path.join(output_dir, filename)}: {str(e)}")
+                        continue
+                    if image_sources is not None:
+                        image_sources[filename] = image_src
+                    placemark = create_placemark(filename, record['latitude'], record['longitude'], record['datetime'], image_src)
+                    xf.write(without_namespace(placemark), pretty_print=True)
+                    written.append(record)
+    return written
+
+def write_preview_kml(kml_file_path, records, output_dir, kml_mode="full", image_sources=None):
+    """
+    Create the KML preview of the processed images with the coordinates of the OCR
+    results in the manifest records, the JPEG files are not parsed again.
 
-    # Create an inverse alpha mask
-    alpha_inv = cv2.bitwise_not(alpha)
+    In 'kmz' mode the KML is written as doc.kml into a KMZ archive, together with
+    the thumbnails it links. The file is replaced at once when it is complete.
 
-    # Extract the original image's alpha channel if it exists, or create one if it doesn't
-    if img.shape[2] == 4:
-        b_img, g_img, r_img, alpha_img = cv2.split(img)
+    Args:
+    - kml_file_path (str): Path of the KML or KMZ file.
+    - records (iterable): Manifest records, images without coordinates are left out.
+    - output_dir (str): Directory of the processed JPEG files.
+    - kml_mode (str): 'full', 'thumbnail' or 'kmz', see get_image_src().
+    - image_sources (dict): Optional image URL cache, see stream_kml().
+
+    Returns:
+    - int: Number of placemarks.
+    """
+    records = sorted((record for record in records if record and has_placemark(record)), key=lambda record: record['output'])
+    temp_path = kml_file_path + ".tmp"
+    if kml_mode == "kmz":
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as kmz:
+            # Viewers open the first KML file of the archive
+            with kmz.open("doc.kml", 'w') as file:
+                written = stream_kml(file, records, output_dir, kml_mode, image_sources)
+            for record in written:
+                # JPEG data does not compress any further
+                kmz.write(os.path.join(output_dir, THUMBNAIL_DIR, record['output']),
+                          f"{THUMBNAIL_DIR}/{record['output']}", compress_type=zipfile.ZIP_STORED)
     else:
-        b_img, g_img, r_img = cv2.split(img)
-        # Create an alpha channel filled with 255 using OpenCV functions
-        alpha_img = cv2.merge((b_img, g_img, r_img, b_img.copy()))
-        alpha_img[:, :, 3] = 255
-
-    # Blend the mask and the original image using the alpha channel
-    for c in range(0, 3):
-        img[:, :, c] = (alpha_inv / 255.0 * img[:, :, c] + (alpha / 255.0 * mask[:, :, c]))
-
-    # Save the masked image
-    masked_image_path = image_path
-    cv2.imwrite(masked_image_path, img)
-    
-    #print(f"Masked image saved to {masked_image_path}")
+        with open(temp_path, 'wb') as file:
+            written = stream_kml(file, records, output_dir, kml_mode, image_sources)
+    os.replace(temp_path, kml_file_path)
+    return len(written)
+
+class PreviewKml:
+    """
+    KML preview which is updated incrementally while images are processed (watch mode).
+
+    The images are linked by their path relative to the KML in the output
+    directory instead of being embedded: the JPEG in 'full' mode, the thumbnail
+    otherwise. New placemarks are inserted at the end of the existing file, the
+    file is only written completely at the start and when the placemark of an
+    image is replaced or removed. Only the manifest records are kept in memory.
+    """
+
+    def __init__(self, kml_file_path, output_dir, kml_mode="full"):
+        """
+        Args:
+        - kml_file_path (str): Path to the KML file in the output directory.
+        - output_dir (str): Directory of the processed JPEG files.
+        - kml_mode (str): 'full', 'thumbnail' or 'kmz', see get_image_src().
+        """
+        self.kml_file_path = kml_file_path
+        self.output_dir = output_dir
+        self.image_mode = "link" if kml_mode == "full" else "thumbnail_link"
+        self.records = {}
+        self.pending = []
+        self.rewrite = True
+
+    def add(self, record):
+        """
+        Add or replace the placemark of an image.
+
+        Args:
+        - record (dict): Manifest record of the image, see process_batch().
+
+        Returns:
+        - bool: True if the image has a placemark.
+        """
+        # The placemark written before is outdated, e.g. the JPEG was written again
+        if record.get('output') in self.records:
+            self.rewrite = True
+        if not has_placemark(record):
+            self.records.pop(record.get('output'), None)
+            return False
+        self.records[record['output']] = record
+        self.pending.append(record)
+        return True
+
+    def write(self):
+        """
+        Write the placemarks added since the last call into the KML file.
+
+        Returns:
+        - int: Number of placemarks.
+        """
+        if self.rewrite or not os.path.exists(self.kml_file_path):
+            write_preview_kml(self.kml_file_path, self.records.values(), self.output_dir, self.image_mode)
+            self.rewrite = False
+            self.pending = []
+            return len(self.records)
+        if not self.pending:
+            return len(self.records)
+
+        placemarks = []
+        for record in self.pending:
+            filename = record['output']
+            try:
+                image_src = get_image_src(self.output_dir, filename, self.image_mode)
+            except Exception as e:
+                print(f"Error processing {os.path.join(self.output_dir, filename)}: {str(e)}")
+                continue
+            placemark = create_placemark(filename, record['latitude'], record['longitude'], record['datetime'], image_src)
+            placemarks.append(etree.tostring(without_namespace(placemark), pretty_print=True))
+        self.pending = []
+        with open(self.kml_file_path, 'r+b') as file:
+            # Insert the placemarks before the closing tags of the document
+            tail_start = file.seek(max(0, os.path.getsize(self.kml_file_path) - 64))
+            tail = file.read()
+            footer = tail.rindex(b"</Document>")
+            file.seek(tail_start + footer)
+            file.write(b"".join(placemarks) + tail[footer:])
+        return len(self.records)
+
+class MaskCompositor:
+    """
+    Blend an RGBA mask (pgu_mask.png) into images with fixed-point integer arithmetic.
+
+    The mask is read once. Only the window where the mask alpha is not zero is
+    blended, and all three channels are computed in one uint16 operation in
+    place, using a single temporary buffer of the window size.
+    """
 
-def add_exif_information(image_path, date_text, time_text,  lat, lon):
+    def __init__(self, mask_path):
+        """
+        Load the mask and precompute the inverse alpha and the premultiplied mask colors.
+
+        Args:
+        - mask_path (str): Path to the mask image with alpha channel.
+        """
+        mask = cv2.imread(mask_path, cv2.IMREAD_UNCHANGED)
+        if mask is None:
+            raise ValueError(f"Error loading the mask image {mask_path}. Please check the file path.")
+        if mask.ndim != 3 or mask.shape[2] != 4:
+            raise ValueError(f"The mask image {mask_path} has no alpha channel.")
+
+        self.shape = mask.shape[:2]
+        alpha = mask[:, :, 3]
+        rows = np.flatnonzero(alpha.any(axis=1))
+        cols = np.flatnonzero(alpha.any(axis=0))
+        if rows.size == 0:
+            # Fully transparent mask, nothing to blend
+            self.window = None
+            return
+        self.window = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+
+        alpha = alpha[self.window][:, :, np.newaxis].astype(np.uint16)
+        self.alpha_inv = 255 - alpha
+        # mask * alpha + 128, the 128 rounds the division by 255 in apply()
+        self.premultiplied = mask[self.window][:, :, :3].astype(np.uint16) * alpha + 128
+
+    def apply(self, img):
+        """
+        Blend the mask into an image: img * (255 - alpha) / 255 + mask * alpha / 255.
+
+        Args:
+        - img (numpy.ndarray): uint8 BGR or BGRA image of the mask size, modified in place.
+
+        Returns:
+        - numpy.ndarray: The masked image.
+        """
+        if img.shape[:2] != self.shape:
+            raise ValueError(f"The mask size {self.shape} does not match the image size {img.shape[:2]}.")
+        if self.window is None:
+            return img
+
+        region = img[self.window][:, :, :3]
+        # At most 255 * 255 + 128, fits into uint16
+        blend = self.premultiplied + region * self.alpha_inv
+        # Divide by 255 without floats: (x + (x >> 8)) >> 8, the uint8 region serves as scratch buffer
+        np.right_shift(blend, 8, out=region, casting='unsafe')
+        np.add(blend, region, out=blend, casting='unsafe')
+        np.right_shift(blend, 8, out=region, casting='unsafe')
+        return img
+
+@functools.lru_cache(maxsize=None)
+def get_mask_compositor(path):
     """
-    Add or modify EXIF information (date, time, GPS coordinates) in an image file.
+    Return the MaskCompositor of a mask file, the mask is loaded once per process.
 
     Args:
-    - image_path (str): Path to the image file.
+    - path (str): Path to the mask image.
+
+    Returns:
+    - MaskCompositor: Compositor of the mask.
+    """
+    return MaskCompositor(path)
+
+def apply_mask(img):
+    """
+    Apply the mask (mask_path) to an image in memory.
+
+    Args:
+    - img (numpy.ndarray): BGR or BGRA image, modified in place.
+
+    Returns:
+    - numpy.ndarray: The masked image.
+    """
+    return get_mask_compositor(mask_path).apply(img)
+
+def build_exif_jpeg(jpeg_data, date_text, time_text, lat, lon):
+    """
+    Add EXIF information (date, time, GPS coordinates) to JPEG data in memory.
+
+    Args:
+    - jpeg_data (bytes): Encoded JPEG image.
     - date_text (str): Date in text format (YYYY MM DD).
     - time_text (str): Time in text format (HH:MM:SS).
     - lat (tuple): Latitude tuple (degrees, minutes, seconds, direction).
     - lon (tuple): Longitude tuple (degrees, minutes, seconds, direction).
 
     Returns:
-    - bool: True if EXIF information is successfully added, False otherwise.
+    - bytes: JPEG data with the EXIF block, the image data itself is not re-encoded.
     """
-    try:
-        with open(image_path, 'rb') as image_file:
-            img = ExifImage(image_file)
-        
-        exif_date_time = datetime.strptime(f"{date_text} {time_text}", "%Y %m %d %H:%M:%S")
-        #print(exif_date_time)
-        img.datetime_original = exif_date_time.strftime(DATETIME_STR_FORMAT)
-        img.datetime_digitized = exif_date_time.strftime(DATETIME_STR_FORMAT)
-
-        if lat and lon:
-            img.gps_latitude = (float(lat[0]), float(lat[1]), float(lat[2]))
-            img.gps_latitude_ref = "N" if lat[3] == 'N' else 'S'
-            img.gps_longitude = (float(lon[0]), float(lon[1]), float(lon[2]))
-            img.gps_longitude_ref = "E" if lon[3] == 'E' else 'W'
-        
-        with open(image_path, 'wb') as new_image_file:
-            new_image_file.write(img.get_file())
-        
-        return True
-    
-    except Exception as e:
-        return f"Error: {str(e)}"
+    img = ExifImage(jpeg_data)
+
+    exif_date_time = datetime.strptime(f"{date_text} {time_text}", "%Y %m %d %H:%M:%S")
+    img.datetime_original = exif_date_time.strftime(DATETIME_STR_FORMAT)
+    img.datetime_digitized = exif_date_time.strftime(DATETIME_STR_FORMAT)
+
+    if lat and lon:
+        img.gps_latitude = (float(lat[0]), float(lat[1]), float(lat[2]))
+        img.gps_latitude_ref = "N" if lat[3] == 'N' else 'S'
+        img.gps_longitude = (float(lon[0]), float(lon[1]), float(lon[2]))
+        img.gps_longitude_ref = "E" if lon[3] == 'E' else 'W'
+
+    return img.get_file()
+
+def write_file(file_path, data):
+    """
+    Write data to a file in one operation. A temporary file is renamed in place,
+    so an interrupted run never leaves a half written file behind.
+
+    Args:
+    - file_path (str): Path to the file.
+    - data (bytes): File content.
+    """
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, file_path)
 
 def crop_image(image, bbox):
     """
@@ -299,6 +648,658 @@ def crop_image(image, bbox):
     x1, y1, x2, y2 = bbox
     return image[y1:y2, x1:x2]
 
+class LazyReader:
+    """
+    EasyOCR reader which imports torch and easyocr and loads the model on first use.
+
+    Runs in which every box is read by the glyph templates ('template' OCR mode)
+    never pay for loading torch and the model.
+    """
+
+    def __init__(self, threads=None, verbose=True):
+        """
+        Args:
+        - threads (int): Number of torch threads, None for the torch default.
+        - verbose (bool): Passed to easyocr.Reader.
+        """
+        self.threads = threads
+        self.verbose = verbose
+        self.reader = None
+
+    def __getattr__(self, name):
+        # Only called for the attributes of easyocr.Reader, the own ones are set in __init__
+        if self.reader is None:
+            import torch
+            import easyocr
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            self.reader = easyocr.Reader(['en'], gpu=False, model_storage_directory='model\\', verbose=self.verbose)
+        return getattr(self.reader, name)
+
+class OcrServiceClient:
+    """
+    Reader which sends the OCR requests to the resident OCR service, see serve_ocr().
+
+    Provides readtext() like easyocr.Reader and is accepted by recognize_crops().
+    If the service stops during the run, the remaining requests are read by an
+    in-process LazyReader.
+    """
+
+    def __init__(self, connection, threads=None, verbose=True):
+        """
+        Args:
+        - connection (multiprocessing.connection.Connection): Connection to the service.
+        - threads (int): Number of torch threads of the fallback reader.
+        - verbose (bool): Passed to easyocr.Reader of the fallback reader.
+        """
+        self.connection = connection
+        self.fallback = LazyReader(threads, verbose)
+
+    @classmethod
+    def connect(cls, threads=None, verbose=True):
+        """
+        Connect to the OCR service announced in OCR_SERVICE_FILE.
+
+        Args:
+        - threads (int): Number of torch threads of the fallback reader.
+        - verbose (bool): Passed to easyocr.Reader of the fallback reader.
+
+        Returns:
+        - OcrServiceClient: Connected client, None if no service is running.
+        """
+        try:
+            with open(OCR_SERVICE_FILE, 'r') as file:
+                service = json.load(file)
+            connection = multiprocessing.connection.Client(tuple(service['address']),
+                                                           authkey=bytes.fromhex(service['authkey']))
+        except (OSError, ValueError, KeyError, EOFError, multiprocessing.AuthenticationError):
+            return None
+        return cls(connection, threads, verbose)
+
+    def request(self, command, *params):
+        """
+        Send a request to the service, or run it in this process if the service is gone.
+
+        Args:
+        - command (str): 'recognize' or 'readtext', see serve_ocr_connection().
+        - params: Parameters of the command.
+
+        Returns:
+        - The result of recognize_crops() or readtext().
+        """
+        if self.connection is not None:
+            try:
+                self.connection.send((command,) + params)
+                status, result = self.connection.recv()
+            except (OSError, EOFError):
+                print(f"{Fore.YELLOW}OCR service not reachable, continuing with the OCR in this process.{Style.RESET_ALL}")
+                self.connection = None
+            else:
+                if status == 'error':
+                    raise RuntimeError(f"OCR service: {result}")
+                return result
+
+        if command == 'recognize':
+            return recognize_crops(params[0], self.fallback)
+        image, kwargs = params
+        return self.fallback.readtext(image, **kwargs)
+
+    def recognize(self, crops):
+        """
+        Recognize box crops in the service, see recognize_crops().
+        """
+        return self.request('recognize', crops)
+
+    def readtext(self, image, **kwargs):
+        """
+        Run easyocr.Reader.readtext() in the service.
+        """
+        return self.request('readtext', image, kwargs)
+
+def create_reader(threads=None, verbose=True, use_ocr_service=True):
+    """
+    Create the reader of a process: the client of the OCR service if one is
+    running, otherwise an in-process LazyReader.
+
+    Args:
+    - threads (int): Number of torch threads of the in-process reader.
+    - verbose (bool): Passed to easyocr.Reader.
+    - use_ocr_service (bool): Use the OCR service if it is running.
+
+    Returns:
+    - OcrServiceClient or LazyReader: Reader for process_batch().
+    """
+    client = OcrServiceClient.connect(threads, verbose) if use_ocr_service else None
+    return client or LazyReader(threads, verbose)
+
+def serve_ocr_connection(connection, reader, lock):
+    """
+    Answer the requests of one client of the OCR service until it disconnects.
+
+    Requests are tuples ('recognize', crops) for recognize_crops() and
+    ('readtext', image, kwargs) for readtext(). Answers are ('ok', result) or
+    ('error', message).
+
+    Args:
+    - connection (multiprocessing.connection.Connection): Connection to the client.
+    - reader (LazyReader): The reader of the service.
+    - lock (threading.Lock): Serializes the use of the model.
+    """
+    with connection:
+        while True:
+            try:
+                command, *params = connection.recv()
+            except (OSError, EOFError):
+                return
+            try:
+                with lock:
+                    if command == 'recognize':
+                        result = recognize_crops(params[0], reader)
+                    elif command == 'readtext':
+                        image, kwargs = params
+                        result = reader.readtext(image, **kwargs)
+                    else:
+                        raise ValueError(f"Unknown request {command}.")
+                answer = ('ok', result)
+            except Exception as e:
+                answer = ('error', str(e))
+            try:
+                connection.send(answer)
+            except (OSError, EOFError):
+                return
+
+def serve_ocr(threads=None):
+    """
+    Run the resident OCR service until Ctrl+C: load the model once and read the
+    crops sent by the processing runs (OcrServiceClient), so they do not load
+    torch and the model themselves.
+
+    The service listens on a local port. The port and a random key are written to
+    OCR_SERVICE_FILE, only clients which can read the file can connect.
+
+    Args:
+    - threads (int): Number of torch threads, None for the torch default.
+    """
+    reader = LazyReader(threads)
+    print("Loading the OCR model ...")
+    reader.character
+    lock = threading.Lock()
+    authkey = os.urandom(32)
+    listener = multiprocessing.connection.Listener(('127.0.0.1', 0), authkey=authkey)
+
+    # Create the file with owner permissions only, a stale file of another service is replaced
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(OCR_SERVICE_FILE)
+    with os.fdopen(os.open(OCR_SERVICE_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as file:
+        json.dump({'address': list(listener.address), 'authkey': authkey.hex(), 'pid': os.getpid()}, file)
+
+    def accept_connections():
+        while True:
+            try:
+                connection = listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except OSError:
+                # The listener was closed
+                return
+            threading.Thread(target=serve_ocr_connection, args=(connection, reader, lock), daemon=True).start()
+
+    print(f"OCR service listening on {listener.address[0]}:{listener.address[1]}, stop with Ctrl+C")
+    # The main thread only waits, so Ctrl+C also works on Windows
+    accept_thread = threading.Thread(target=accept_connections, daemon=True)
+    accept_thread.start()
+    try:
+        while accept_thread.is_alive():
+            accept_thread.join(0.5)
+    except KeyboardInterrupt:
+        print("OCR service stopped")
+    finally:
+        listener.close()
+        with contextlib.suppress(OSError, ValueError, KeyError):
+            with open(OCR_SERVICE_FILE, 'r') as file:
+                service = json.load(file)
+            if service['authkey'] == authkey.hex():
+                os.remove(OCR_SERVICE_FILE)
+
+class GlyphRecognizer:
+    """
+    Template matching recognizer for the fixed HUD font of the PUG frames.
+
+    A crop is binarized and split into characters at empty pixel columns. Every
+    character is classified by normalized correlation with the glyph templates
+    of the allowed characters. The templates are learned from boxes EasyOCR read
+    with high confidence and are stored in a .npz file between runs.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+        - path (str): .npz file with glyph templates, loaded if it exists.
+        """
+        self.templates = {}
+        self.learned = []
+        self.changed = False
+        if path and os.path.exists(path):
+            data = np.load(path)
+            for char, vector in zip(data['chars'], data['vectors']):
+                self.templates.setdefault(str(char), []).append(vector)
+
+    def save(self, path):
+        """
+        Save the glyph templates.
+
+        Args:
+        - path (str): .npz file.
+        """
+        chars = [char for char, vectors in self.templates.items() for _ in vectors]
+        vectors = [vector for char_vectors in self.templates.values() for vector in char_vectors]
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, chars=np.array(chars), vectors=np.array(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        self.changed = False
+
+    @staticmethod
+    def segment(crop):
+        """
+        Split a grey crop into normalized character glyphs.
+
+        Args:
+        - crop (numpy.ndarray): Grey image of one box.
+
+        Returns:
+        - list: Zero mean, unit length glyph vectors from left to right.
+        """
+        _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # The characters cover less than half of the box, whatever their color
+        if np.count_nonzero(binary) > binary.size // 2:
+            binary = cv2.bitwise_not(binary)
+
+        columns = np.flatnonzero(binary.any(axis=0))
+        glyphs = []
+        for run in np.split(columns, np.flatnonzero(np.diff(columns) > 1) + 1):
+            if run.size == 0:
+                continue
+            glyph = binary[:, run[0]:run[-1] + 1]
+            rows = np.flatnonzero(glyph.any(axis=1))
+            glyph = glyph[rows[0]:rows[-1] + 1]
+            height, width = glyph.shape
+            if height < 3:
+                # Noise, no character is this flat
+                continue
+
+            # Scale to GLYPH_SIZE height keeping the aspect ratio and center on a square canvas
+            new_width = max(1, min(GLYPH_SIZE, round(width * GLYPH_SIZE / height)))
+            canvas = np.zeros((GLYPH_SIZE, GLYPH_SIZE), np.float32)
+            left = (GLYPH_SIZE - new_width) // 2
+            canvas[:, left:left + new_width] = cv2.resize(glyph, (new_width, GLYPH_SIZE), interpolation=cv2.INTER_AREA)
+
+            vector = canvas.ravel() - canvas.mean()
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                glyphs.append(vector / norm)
+        return glyphs
+
+    def read(self, crop, allowlist):
+        """
+        Read a box by template matching.
+
+        Args:
+        - crop (numpy.ndarray): Grey image of one box.
+        - allowlist (str): Allowed characters.
+
+        Returns:
+        - tuple: (text, score), the score is the lowest character confidence (0 to 1).
+        """
+        candidates = [char for char in allowlist if char in self.templates]
+        glyphs = self.segment(crop)
+        if not candidates or not glyphs:
+            return '', 0.0
+
+        text = ''
+        score = 1.0
+        for glyph in glyphs:
+            correlations = sorted(((max(float(np.dot(template, glyph)) for template in self.templates[char]), char)
+                                   for char in candidates), reverse=True)
+            best, char = correlations[0]
+            second = correlations[1][0] if len(correlations) > 1 else -1.0
+            # Similar correlations of two characters lower the confidence
+            confidence = best * min(1.0, (best - second) / GLYPH_MARGIN)
+            text += char
+            score = min(score, max(confidence, 0.0))
+        return text, score
+
+    def learn(self, crop, text):
+        """
+        Add the glyphs of a box with known text as templates, if it segments into one glyph per character.
+
+        Args:
+        - crop (numpy.ndarray): Grey image of one box.
+        - text (str): Text of the box.
+        """
+        glyphs = self.segment(crop)
+        if len(glyphs) == len(text):
+            self.add(zip(text, glyphs))
+
+    def add(self, samples):
+        """
+        Add glyph templates, at most GLYPH_SAMPLES per character.
+
+        Args:
+        - samples (iterable): (character, glyph vector) tuples.
+        """
+        for char, glyph in samples:
+            templates = self.templates.setdefault(char, [])
+            if len(templates) < GLYPH_SAMPLES:
+                templates.append(glyph)
+                self.learned.append((char, glyph))
+                self.changed = True
+
+    def pop_learned(self):
+        """
+        Return and forget the templates learned since the last call, used to pass them from the workers to the main process.
+
+        Returns:
+        - list: (character, glyph vector) tuples.
+        """
+        learned, self.learned = self.learned, []
+        return learned
+
+# Glyph templates of the 'template' OCR mode, loaded in main() and init_worker()
+glyph_recognizer = GlyphRecognizer()
+
+class OcrCache:
+    """
+    Results of recognized box crops, keyed on a hash of the raw crop pixels.
+
+    Consecutive PUG frames often show the same coordinate readout, the boxes
+    with unchanged pixels then reuse the earlier text and score. The oldest
+    entries are dropped when the cache is full.
+    """
+
+    def __init__(self, max_entries=1024):
+        """
+        Args:
+        - max_entries (int): Maximum number of cached crops.
+        """
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+    @staticmethod
+    def key(crop, allowlist):
+        """
+        Hash a crop together with its shape and allowlist.
+
+        Args:
+        - crop (numpy.ndarray): Grey image of one box.
+        - allowlist (str): Allowed characters.
+
+        Returns:
+        - bytes: Cache key.
+        """
+        digest = hashlib.blake2b(crop.tobytes(), digest_size=16)
+        digest.update(f"{crop.shape}{allowlist}".encode())
+        return digest.digest()
+
+    def get(self, key):
+        """
+        Return the cached (text, score) of a key, None if it is not cached.
+        """
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        """
+        Cache the (text, score) of a key.
+        """
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+# Cache of the recognized box crops, None if disabled (--no-ocr-cache)
+ocr_cache = OcrCache()
+
+def field_crops(img):
+    """
+    Crop all coordinate fields (FIELDS) of an image.
+
+    Args:
+    - img (numpy.ndarray): 1920x1080 BGR image.
+
+    Returns:
+    - dict: Field name -> grey crop (numpy.ndarray).
+    """
+    return {name: cv2.cvtColor(crop_image(img, field['bbox']), cv2.COLOR_BGR2GRAY) for name, field in FIELDS.items()}
+
+def field_result(name, text, score):
+    """
+    Build the readtext()-like result of a field.
+
+    Args:
+    - name (str): Field name.
+    - text (str): Recognized text.
+    - score (float): Confidence score.
+
+    Returns:
+    - list: [(box, text, score)] with the field box in image coordinates, empty if no text was read.
+    """
+    x1, y1, x2, y2 = FIELDS[name]['bbox']
+    return [([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], text, score)] if text.strip() else []
+
+def recognize_fields(img, reader, ocr_mode="recognize"):
+    """
+    Extract the text of all coordinate fields (FIELDS) of a frame.
+
+    In 'recognize' mode the fixed bounding boxes are passed straight to the
+    EasyOCR recognizer, so the CRAFT text detector never runs. In 'detect' mode
+    every crop goes through reader.readtext(), see readtext_adaptive(). In 'template' mode the boxes are
+    read by the glyph templates (glyph_recognizer) first, see recognize_batch().
+
+    Args:
+    - img (numpy.ndarray): 1920x1080 BGR image.
+    - reader (easyocr.Reader): EasyOCR reader instance.
+    - ocr_mode (str): 'recognize', 'detect' or 'template'.
+
+    Returns:
+    - dict: Field name -> list of (box, text, score) tuples like readtext(), empty if nothing was read.
+    """
+    if ocr_mode == "detect":
+        return {name: readtext_adaptive(crop_image(img, field['bbox']), field, reader) for name, field in FIELDS.items()}
+
+    return recognize_batch([img], reader, ocr_mode)[0]
+
+def readtext_adaptive(crop, field, reader):
+    """
+    Read a field box with reader.readtext() in up to two passes: first with the
+    cheap FIRST_PASS_READTEXT settings, and only if nothing or nothing above
+    escalation_threshold was read, again with the full settings of the field.
+
+    Args:
+    - crop (numpy.ndarray): BGR crop of the field box.
+    - field (dict): Entry of FIELDS.
+    - reader (easyocr.Reader): EasyOCR reader instance.
+
+    Returns:
+    - list: (box, text, score) tuples like readtext().
+    """
+    #Fine Tune Here with the parameters based on https://www.jaided.ai/easyocr/documentation/
+    if not escalation_threshold:
+        return reader.readtext(crop, allowlist=field['allowlist'], **field['readtext'])
+
+    ocr_stats['first_pass'] += 1
+    result = reader.readtext(crop, allowlist=field['allowlist'], **FIRST_PASS_READTEXT)
+    if result and result[0][2] >= escalation_threshold:
+        return result
+    ocr_stats['escalated'] += 1
+    second = reader.readtext(crop, allowlist=field['allowlist'], **field['readtext'])
+    return second if second and (not result or second[0][2] >= result[0][2]) else result
+
+def enhance_crop(crop):
+    """
+    Prepare a grey box crop for the second recognition pass: enlarge it, stretch
+    the contrast to the full range and add a border, so the characters do not
+    touch the edge.
+
+    Args:
+    - crop (numpy.ndarray): Grey crop.
+
+    Returns:
+    - numpy.ndarray: Enhanced grey crop.
+    """
+    enlarged = cv2.resize(crop, None, fx=ESCALATION_MAG_RATIO, fy=ESCALATION_MAG_RATIO, interpolation=cv2.INTER_CUBIC)
+    stretched = cv2.normalize(enlarged, None, 0, 255, cv2.NORM_MINMAX)
+    border = ESCALATION_BORDER * ESCALATION_MAG_RATIO
+    return cv2.copyMakeBorder(stretched, border, border, border, border, cv2.BORDER_REPLICATE)
+
+def recognize_crops_adaptive(crops, reader):
+    """
+    Recognize box crops with recognize_crops() and read the crops with a score
+    below escalation_threshold a second time, enhanced (enhance_crop()). The
+    result with the higher score is kept.
+
+    Args:
+    - crops (list): (allowlist, grey crop) tuples.
+    - reader (easyocr.Reader): EasyOCR reader instance, or the client of the OCR service.
+
+    Returns:
+    - list: (text, score) per crop, in input order.
+    """
+    results = recognize_crops(crops, reader)
+    ocr_stats['first_pass'] += len(crops)
+    if not escalation_threshold:
+        return results
+
+    weak = [index for index, (_, score) in enumerate(results) if score < escalation_threshold]
+    if weak:
+        ocr_stats['escalated'] += len(weak)
+        second = recognize_crops([(crops[index][0], enhance_crop(crops[index][1])) for index in weak], reader)
+        for index, (text, score) in zip(weak, second):
+            if score > results[index][1]:
+                results[index] = (text, score)
+    return results
+
+def recognize_crops(crops, reader):
+    """
+    Recognize box crops with the EasyOCR recognition model, without text detection.
+
+    All crops with the same allowlist (digits, NS, EW) are sent through the
+    model in one batch. Memory grows with the number of crops.
+
+    Args:
+    - crops (list): (allowlist, grey crop) tuples.
+    - reader (easyocr.Reader): EasyOCR reader instance, or the client of the OCR service.
+
+    Returns:
+    - list: (text, score) per crop, in input order.
+    """
+    if isinstance(reader, OcrServiceClient):
+        return reader.recognize(crops)
+
+    from easyocr.config import imgH as model_height
+    from easyocr.recognition import get_text
+    from easyocr.utils import get_image_list
+
+    results = [('', 0.0)] * len(crops)
+    for allowlist in dict.fromkeys(allowlist for allowlist, _ in crops):
+        image_list = []
+        indices = []
+        max_width = model_height
+        for index, (crop_allowlist, crop) in enumerate(crops):
+            if crop_allowlist == allowlist:
+                height, width = crop.shape
+                # Resize the crop to the model height the same way Reader.recognize() does
+                crop_list, crop_width = get_image_list([[0, width, 0, height]], [], crop, model_height=model_height)
+                image_list += crop_list
+                indices += [index] * len(crop_list)
+                max_width = max(max_width, crop_width)
+
+        if not image_list:
+            continue
+        ignore_char = ''.join(set(reader.character) - set(allowlist))
+        # Reader.recognize() loops over the boxes one by one on CPU, get_text() runs them as one batch
+        recognized = get_text(reader.character, model_height, int(max_width), reader.recognizer, reader.converter,
+                              image_list, ignore_char, batch_size=len(image_list), workers=0, device=reader.device)
+        # get_text() returns the results in input order
+        for index, (_, text, score) in zip(indices, recognized):
+            results[index] = (text, score)
+    return results
+
+def recognize_batch(images, reader, ocr_mode="recognize"):
+    """
+    Recognize the coordinate fields (FIELDS) of several images in one recognizer pass.
+
+    The crops of all images are collected and sent through the EasyOCR
+    recognition model as one batch per allowlist (recognize_crops), boxes with a
+    low score a second time (recognize_crops_adaptive()). Crops with
+    the same pixels as an earlier one reuse its result from the OCR cache
+    (ocr_cache). In 'template' mode the boxes are read by the glyph templates first, and only
+    boxes with a score below template_threshold are sent to EasyOCR. Boxes
+    EasyOCR reads with such a score are learned as new templates.
+
+    Args:
+    - images (list): 1920x1080 BGR images (numpy.ndarray).
+    - reader (easyocr.Reader): EasyOCR reader instance.
+    - ocr_mode (str): 'recognize' or 'template'.
+
+    Returns:
+    - list: One dict per image, field name -> list of (box, text, score) tuples
+      like readtext(), empty if nothing was read. Boxes are in image coordinates.
+    """
+    texts = [{} for _ in images]
+    pending = []
+    for index, img in enumerate(images):
+        for name, crop in field_crops(img).items():
+            allowlist = FIELDS[name]['allowlist']
+            key = None
+            if ocr_cache is not None:
+                key = ocr_cache.key(crop, allowlist)
+                cached = ocr_cache.get(key)
+                if cached is not None:
+                    texts[index][name] = field_result(name, *cached)
+                    ocr_stats['cache_hit'] += 1
+                    continue
+
+            if ocr_mode == "template":
+                text, score = glyph_recognizer.read(crop, allowlist)
+                if score >= template_threshold:
+                    texts[index][name] = field_result(name, text, score)
+                    ocr_stats['template'] += 1
+                    if key is not None:
+                        ocr_cache.put(key, (text, score))
+                        ocr_stats['cache_miss'] += 1
+                    continue
+            pending.append((index, name, crop, key))
+
+    if pending:
+        # Identical crops within the batch are recognized only once
+        crops = []
+        positions = []
+        first_positions = {}
+        for _, name, crop, key in pending:
+            if key is not None and key in first_positions:
+                positions.append(first_positions[key])
+                ocr_stats['cache_hit'] += 1
+                continue
+            if key is not None:
+                first_positions[key] = len(crops)
+                ocr_stats['cache_miss'] += 1
+            positions.append(len(crops))
+            crops.append((FIELDS[name]['allowlist'], crop))
+            if ocr_mode == "template":
+                ocr_stats['easyocr_fallback'] += 1
+
+        results = recognize_crops_adaptive(crops, reader)
+        for (index, name, crop, key), position in zip(pending, positions):
+            text, score = results[position]
+            texts[index][name] = field_result(name, text, score)
+            if key is not None:
+                ocr_cache.put(key, (text, score))
+            if ocr_mode == "template" and score >= template_threshold:
+                glyph_recognizer.learn(crop, text.strip())
+
+    return [{name: image_texts[name] for name in FIELDS} for image_texts in texts]
+
 def print_extracted_text(label, extracted_text):
     """
     Print extracted text and confidence score.
@@ -317,181 +1318,1106 @@ def print_extracted_text(label, extracted_text):
             formatted_score = score_str
         print(f"{label}: {text} with score: {formatted_score}")
 
-def process_image(image_path, reader):
+def load_image(image_path, data=None):
     """
-    Processes an image to extract latitude and longitude coordinates.
+    Load an image and verify that it is a 1920x1080 PUG frame.
 
-    Parameters:
-    -----------
-    image_path : str
-        The file path to the image to be processed.
-    reader : easyocr.Reader
-        An EasyOCR reader instance used for text recognition.
+    Args:
+    - image_path (str): Path to the image file.
+    - data (bytes): Content of the image file, read from image_path if not given.
+
+    Returns:
+    - numpy.ndarray: BGR image, None if the dimensions are not 1920x1080.
 
     Raises:
-    -------
-    ValueError
-        If the image cannot be loaded or if its dimensions are not 1920x1080 pixels.
-
-    Description:
-    ------------
-    This function reads an image from the specified path, checks its dimensions,
-    and extracts text from predefined bounding boxes corresponding to latitude
-    and longitude coordinates. The extracted text is then printed and the image
-    is saved with EXIF metadata.
-
-    Steps:
-    ------
-    1. Load the image.
-    2. Verify the image dimensions.
-    3. Define bounding boxes for latitude and longitude regions.
-    4. Crop the image to these regions.
-    5. Use EasyOCR to extract text from the cropped regions.
-    6. Print the extracted text in the desired format.
-    7. Save with mask the processed image with EXIF metadata.
-    """
-    img = cv2.imread(image_path)
+    - ValueError: If the image cannot be loaded.
+    """
+    if data is None:
+        img = cv2.imread(image_path)
+    else:
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
     if img is None:
         raise ValueError(f"Error loading the image {image_path}. Please check the file path.")
-    
-    height, width, _ = img.shape
+    return check_dimensions(img, image_path)
+
+def check_dimensions(img, image_path):
+    """
+    Verify that an image is a 1920x1080 PUG frame.
+
+    Args:
+    - img (numpy.ndarray): BGR image.
+    - image_path (str): Path to the image, for the message.
+
+    Returns:
+    - numpy.ndarray: The image, None if the dimensions are not 1920x1080.
+    """
+    height, width = img.shape[:2]
     if width != 1920 or height != 1080:
         print(f"The image {image_path} has dimensions {width}x{height}.")
         print("Extraction works only for 1920x1080 imagery.")
-    else:
-        lat_dd_bbox = (1670, 988, 1725, 1017)
-        lat_mm_bbox = (1744, 988, 1799, 1017)
-        lat_ss_bbox = (1820, 988, 1867, 1017)
-        lat_dir_bbox = (1866, 988, 1891, 1017)
-        lon_dd_bbox = (1670, 1018, 1730, 1060)
-        lon_mm_bbox = (1744, 1018, 1799, 1049)
-        lon_ss_bbox = (1820, 1018, 1867, 1049)
-        lon_dir_bbox = (1866, 1018, 1891, 1049)
-
-        lat_dd_img = crop_image(img, lat_dd_bbox)
-        lat_mm_img = crop_image(img, lat_mm_bbox)
-        lat_ss_img = crop_image(img, lat_ss_bbox)
-        lat_dir_img = crop_image(img, lat_dir_bbox)
-        lon_dd_img = crop_image(img, lon_dd_bbox)
-        lon_mm_img = crop_image(img, lon_mm_bbox)
-        lon_ss_img = crop_image(img, lon_ss_bbox)
-        lon_dir_img = crop_image(img, lon_dir_bbox)
-
-        #Fine Tune Here with the parameters based on https://www.jaided.ai/easyocr/documentation/     
-        lat_dd_text = reader.readtext(lat_dd_img, allowlist='0123456789', mag_ratio=3,text_threshold=0.6)
-        lat_mm_text = reader.readtext(lat_mm_img, allowlist='0123456789', mag_ratio=3,text_threshold=0.6)
-        lat_ss_text = reader.readtext(lat_ss_img, allowlist='0123456789', mag_ratio=3,text_threshold=0.6)
-        lat_dir_text = reader.readtext(lat_dir_img, allowlist='NS', mag_ratio=3,text_threshold=0.6)
-        lon_dd_text = reader.readtext(lon_dd_img, allowlist='0123456789', mag_ratio=2)
-        lon_mm_text = reader.readtext(lon_mm_img, allowlist='0123456789', mag_ratio=3,text_threshold=0.6)
-        lon_ss_text = reader.readtext(lon_ss_img, allowlist='0123456789', mag_ratio=3,text_threshold=0.6)
-        lon_dir_text = reader.readtext(lon_dir_img, allowlist='EW', mag_ratio=3,text_threshold=0.6)
-
-        # print_extracted_text("Latitude DD", lat_dd_text)
-        # print_extracted_text("Latitude MM", lat_mm_text)
-        # print_extracted_text("Latitude SS", lat_ss_text)
-        # print_extracted_text("Latitude Direction", lat_dir_text)
-        # print_extracted_text("Longitude DD", lon_dd_text)
-        # print_extracted_text("Longitude MM", lon_mm_text)
-        # print_extracted_text("Longitude SS", lon_ss_text)
-        # print_extracted_text("Longitude Direction", lon_dir_text)
-
-        # Print the extracted text in the desired format
-        
-        #print(image_path)
-        if all([lat_dd_text, lat_mm_text, lat_ss_text, lat_dir_text]):
-            print(f"{lat_dd_text[0][1]} : {lat_mm_text[0][1]} : {lat_ss_text[0][1]}{lat_dir_text[0][1]}")
-        if all([lon_dd_text, lon_mm_text, lon_ss_text, lon_dir_text]):
-            print(f"{lon_dd_text[0][1]} : {lon_mm_text[0][1]} : {lon_ss_text[0][1]}{lon_dir_text[0][1]}")
-        print_lowest_confidence_score(lat_dd_text, lat_mm_text, lat_ss_text, lat_dir_text, 
-                                  lon_dd_text, lon_mm_text, lon_ss_text, lon_dir_text)
+        return None
+    return img
+
+def datetime_from_filename(filename):
+    """
+    Get the time an image was taken from its file name (iYYMMDD_HHMMSS-N.png).
+
+    Args:
+    - filename (str): Name of the PNG file.
+
+    Returns:
+    - str: Date and time in EXIF format (YYYY:MM:DD HH:MM:SS), None if the file name does not match.
+    """
+    match = re.match(FILENAME_PATTERN, filename)
+    if not match:
+        return None
+    date_part, time_part = match.groups()
+    return f"20{date_part[:2]}:{date_part[2:4]}:{date_part[4:6]} {time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}"
+
+def texts_to_decimal(texts, prefix):
+    """
+    Convert the OCR results of a coordinate to decimal degrees.
+
+    Args:
+    - texts (dict): Field name -> [text, score], see process_batch().
+    - prefix (str): 'lat' or 'lon'.
+
+    Returns:
+    - float: Decimal degrees, None if a field is missing or not a number.
+    """
+    parts = [texts.get(f"{prefix}_{part}") for part in ('dd', 'mm', 'ss', 'dir')]
+    if not all(parts):
+        return None
+    try:
+        degrees = float(parts[0][0]) + float(parts[1][0]) / 60 + float(parts[2][0]) / 3600
+    except ValueError:
+        return None
+    return -degrees if parts[3][0] in ('S', 'W') else degrees
+
+def report_error(record, image_path, message):
+    """
+    Print an error and add it to the manifest record of an image.
+
+    Args:
+    - record (dict): Manifest record of the image.
+    - image_path (str): Path to the image.
+    - message (str): Error message.
+    """
+    print(f"{Fore.RED} FAILED ON: {image_path} - {message}{Style.RESET_ALL}\n")
+    record['errors'].append(f"{image_path} - {message}")
+
+def process_batch(image_paths, reader, ocr_mode="recognize", known_texts=None, frames=None):
+    """
+    Process several images, reading the coordinate fields of all of them in one OCR pass.
+
+    Args:
+    - image_paths (list): Paths to the PNG images, all of them are kept in memory at once.
+    - reader (easyocr.Reader): EasyOCR reader instance.
+    - ocr_mode (str): 'recognize' and 'template' batch the crops of all images (recognize_batch),
+      'detect' falls back to recognize_fields() per image.
+    - known_texts (dict): Image path -> (input hash, texts) from the manifest of an
+      earlier run. The stored texts are used instead of the OCR if the hash still matches.
+    - frames (dict): Image path -> (BGR image, position in ms, decode time in s) of
+      frames decoded from a video, see VideoFrameReader. They are not read from disk.
+
+    Returns:
+    - list: One manifest record per image, see RunManifest. The stage timings of
+      the images are added to frame_metrics.
+    """
+    known_texts = known_texts or {}
+    frames = frames or {}
+    records = []
+    images = []
+    timers = {}
+    for image_path in image_paths:
+        timer = timers[image_path] = StageTimer()
+        record = {'input': os.path.basename(image_path), 'size': None, 'mtime': None,
+                  'input_hash': None, 'status': 'failed', 'texts': {}, 'confidence': None,
+                  'latitude': None, 'longitude': None, 'datetime': datetime_from_filename(os.path.basename(image_path)),
+                  'output': None, 'errors': []}
+        records.append(record)
+        if image_path in frames:
+            img, position, decode_time = frames[image_path]
+            record['video'] = os.path.basename(os.path.dirname(image_path))
+            record['position_ms'] = round(position)
+            timer.seconds['decode'] = decode_time
+            with timer.stage('read'):
+                record['input_hash'] = hashlib.sha1(img.data).hexdigest()
+            img = check_dimensions(img, image_path)
+            if img is None:
+                record['status'] = 'skipped'
+            else:
+                images.append((record, image_path, img))
+            continue
+
+        try:
+            stat = os.stat(image_path)
+            record['size'], record['mtime'] = stat.st_size, stat.st_mtime_ns
+            with timer.stage('read'):
+                with open(image_path, 'rb') as file:
+                    data = file.read()
+                record['input_hash'] = hashlib.sha1(data).hexdigest()
+            with timer.stage('decode'):
+                img = load_image(image_path, data)
+        except (OSError, ValueError) as e:
+            report_error(record, image_path, e)
+            continue
+        if img is None:
+            record['status'] = 'skipped'
+            continue
+        images.append((record, image_path, img))
+
+    # Reuse the OCR results of an earlier run if the file did not change
+    texts = {}
+    for record, image_path, _ in images:
+        known = known_texts.get(image_path)
+        if known and known[0] == record['input_hash']:
+            texts[image_path] = {name: field_result(name, *known[1][name]) for name in FIELDS}
+            ocr_stats['manifest_reuse'] += 1
+    pending = [(image_path, img) for _, image_path, img in images if image_path not in texts]
+
+    ocr_timer = StageTimer()
+    with ocr_timer.stage('ocr'):
+        if ocr_mode == "detect":
+            texts.update((image_path, recognize_fields(img, reader, ocr_mode)) for image_path, img in pending)
+        else:
+            texts.update(zip([image_path for image_path, _ in pending],
+                             recognize_batch([img for _, img in pending], reader, ocr_mode)))
+    # The OCR runs for the whole batch, every frame gets an equal share
+    for image_path, _ in pending:
+        timers[image_path].add(ocr_timer, share=1 / len(pending))
+
+    for record, image_path, img in images:
+        image_texts = texts[image_path]
+        record['texts'] = {name: [result[0][1], float(result[0][2])] for name, result in image_texts.items() if result}
+        if record['texts']:
+            record['confidence'] = min(score for _, score in record['texts'].values())
+        latitude = texts_to_decimal(record['texts'], 'lat')
+        longitude = texts_to_decimal(record['texts'], 'lon')
+        if latitude is not None and longitude is not None:
+            record['latitude'], record['longitude'] = latitude, longitude
+        try:
+            jpeg_path, errors = save_processed_image(image_path, img, image_texts, timers[image_path])
+        except Exception as e:
+            report_error(record, image_path, e)
+            continue
+        record['errors'] += errors
+        if jpeg_path:
+            record['output'] = os.path.basename(jpeg_path)
+        record['status'] = 'failed' if record['errors'] else ('done' if jpeg_path else 'skipped')
+
+    for record, image_path in zip(records, image_paths):
+        frame_metrics.append(timers[image_path].to_metrics(record['input'], record['status']))
+    return records
+
+def init_worker(worker_output_dir, worker_mask_path, ocr_mode, threads, glyph_path, threshold, use_ocr_cache,
+                worker_thumbnail_dir, trace_memory, use_ocr_service, second_pass_threshold):
+    """
+    Initialize a worker process of the process pool: set the globals used by the
+    processing functions. The worker keeps its EasyOCR reader for its lifetime,
+    the model is loaded once on first use, or its connection to the OCR service.
+
+    Args:
+    - worker_output_dir (str): Output directory for the JPEG files.
+    - worker_mask_path (str): Path to pgu_mask.png.
+    - ocr_mode (str): 'recognize', 'detect' or 'template'.
+    - threads (int): Number of torch threads per worker.
+    - glyph_path (str): Glyph templates file of the 'template' OCR mode.
+    - threshold (float): Template score below which boxes are read by EasyOCR.
+    - use_ocr_cache (bool): Reuse the results of crops with unchanged pixels.
+    - worker_thumbnail_dir (str): Directory for the preview thumbnails, None to write none.
+    - trace_memory (bool): Trace the peak memory of every stage with tracemalloc.
+    - use_ocr_service (bool): Send the OCR to the OCR service if it is running.
+    - second_pass_threshold (float): EasyOCR score below which a box is read a second time.
+    """
+    global output_dir, mask_path, worker_reader, worker_ocr_mode, glyph_recognizer, template_threshold, ocr_cache
+    global thumbnail_dir, escalation_threshold
+    output_dir = worker_output_dir
+    mask_path = worker_mask_path
+    worker_ocr_mode = ocr_mode
+    glyph_recognizer = GlyphRecognizer(glyph_path)
+    template_threshold = threshold
+    escalation_threshold = second_pass_threshold
+    ocr_cache = OcrCache() if use_ocr_cache else None
+    thumbnail_dir = worker_thumbnail_dir
+    if trace_memory:
+        tracemalloc.start()
+    init()
+    worker_reader = create_reader(threads, verbose=False, use_ocr_service=use_ocr_service)
+
+def process_batch_in_worker(batch):
+    """
+    Process a batch of images in a worker process, see process_batch().
+
+    The console output is captured and returned, so the main process can print
+    the output of each batch as a block.
+
+    Args:
+    - batch (tuple): Paths to the PNG images, their known texts and the video frames, see RunManifest.batch().
+
+    Returns:
+    - dict: Number of images ('count'), console output ('output'), manifest
+      records ('records'), OCR counters ('stats'), newly learned glyph
+      templates ('glyphs') and stage timings ('metrics').
+    """
+    image_paths, known_texts, frames = batch
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        records = process_batch(image_paths, worker_reader, worker_ocr_mode, known_texts, frames)
+    stats = dict(ocr_stats)
+    ocr_stats.clear()
+    return {'count': len(image_paths), 'output': output.getvalue(), 'records': records,
+            'stats': stats, 'glyphs': glyph_recognizer.pop_learned(), 'metrics': pop_frame_metrics()}
+
+class BatchProcessor:
+    """
+    Process batches of images in the main process or in a pool of worker processes.
+
+    With a pool, at most one batch per worker is in flight, further batches
+    wait with the caller. Every worker keeps its EasyOCR reader, see init_worker().
+    """
+
+    def __init__(self, workers, ocr_mode, initargs, use_ocr_service=False):
+        """
+        Args:
+        - workers (int): Number of worker processes, 1 processes the batches in the main process.
+        - ocr_mode (str): 'recognize', 'detect' or 'template'.
+        - initargs (tuple): Arguments of init_worker().
+        - use_ocr_service (bool): Send the OCR of the main process to the OCR service if it is running.
+        """
+        self.ocr_mode = ocr_mode
+        self.workers = workers
+        self.in_flight = []
+        self.finished = []
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=initargs)
+        else:
+            self.pool = None
+            self.reader = create_reader(use_ocr_service=use_ocr_service)
+
+    def has_capacity(self):
+        """
+        Check whether another batch can be submitted without exceeding one batch per worker.
+        """
+        return len(self.in_flight) < self.workers
+
+    def submit(self, batch):
+        """
+        Process a batch, in the main process right away or asynchronously in the pool.
+
+        Args:
+        - batch (tuple): Paths to the PNG images, their known texts and the video frames, see RunManifest.batch().
+        """
+        if self.pool is None:
+            image_paths, known_texts, frames = batch
+            records = process_batch(image_paths, self.reader, self.ocr_mode, known_texts, frames)
+            # The counters and glyph templates are updated in this process directly
+            self.finished.append({'count': len(image_paths), 'output': "", 'records': records, 'stats': {}, 'glyphs': [],
+                                  'metrics': pop_frame_metrics()})
+        else:
+            self.in_flight.append(self.pool.apply_async(process_batch_in_worker, (batch,)))
+
+    def collect(self, wait=False):
+        """
+        Return the results of the finished batches, see process_batch_in_worker().
+
+        Args:
+        - wait (bool): Wait until at least one batch is finished, if any is in flight.
+
+        Returns:
+        - list: Results of the finished batches.
+        """
+        while True:
+            done = [result for result in self.in_flight if result.ready()]
+            if done or not wait or not self.in_flight:
+                break
+            time.sleep(0.05)
+        self.in_flight = [result for result in self.in_flight if result not in done]
+        finished, self.finished = self.finished + [result.get() for result in done], []
+        return finished
+
+    def close(self, terminate=False):
+        """
+        Shut down the worker processes.
+
+        Args:
+        - terminate (bool): Stop the workers immediately, batches in flight are lost.
+        """
+        if self.pool is not None:
+            if terminate:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+            self.pool.join()
+
+def watch_directory(image_dir, manifest, processor, handle_result, batch_size, poll_interval):
+    """
+    Watch the input directory and process new PNG images as they arrive, until Ctrl+C is pressed.
+
+    The directory is polled every poll_interval seconds. A file is queued once
+    its size and modification time did not change between two polls, so files
+    which are still being copied are not read. Files which change later are
+    queued again.
+
+    Args:
+    - image_dir (str): Input directory.
+    - manifest (RunManifest): Manifest of the run, images which are done are not queued.
+    - processor (BatchProcessor): Processor of the batches.
+    - handle_result (callable): Called with the result of every finished batch.
+    - batch_size (int): Maximum number of images per batch.
+    - poll_interval (float): Seconds between two polls.
+    """
+    signatures = {}
+    queued = {}
+    ready = collections.deque()
+    print(f"Watching {image_dir} for new PNG images, press Ctrl+C to stop.")
+    try:
+        while True:
+            with os.scandir(image_dir) as entries:
+                for entry in sorted(entries, key=lambda entry: entry.name):
+                    if not entry.name.endswith(".png"):
+                        continue
+                    stat = entry.stat()
+                    signature = (stat.st_size, stat.st_mtime_ns)
+                    if queued.get(entry.path) == signature:
+                        continue
+                    if signatures.get(entry.path) == signature and stat.st_size > 0:
+                        queued[entry.path] = signature
+                        if not manifest.is_done(entry.path):
+                            ready.append(entry.path)
+                    signatures[entry.path] = signature
+
+            while ready and processor.has_capacity():
+                processor.submit(manifest.batch([ready.popleft() for _ in range(min(batch_size, len(ready)))]))
+
+            # With a backlog and all workers busy, wait for a batch instead of polling the directory again
+            backlog = bool(ready) and not processor.has_capacity()
+            for result in processor.collect(wait=backlog):
+                handle_result(result)
+            if not backlog:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
         print("")
-        print("*****************************************")
-
-        # Check if any text extraction results are empty
-        if not all([lat_dd_text, lat_mm_text, lat_ss_text, lat_dir_text, lon_dd_text, lon_mm_text, lon_ss_text, lon_dir_text]):
-            missing_parts = []
-            if not lat_dd_text:
-                missing_parts.append("lat_dd_text")
-            if not lat_mm_text:
-                missing_parts.append("lat_mm_text")
-            if not lat_ss_text:
-                missing_parts.append("lat_ss_text")
-            if not lat_dir_text:
-                missing_parts.append("lat_dir_text")
-            if not lon_dd_text:
-                missing_parts.append("lon_dd_text")
-            if not lon_mm_text:
-                missing_parts.append("lon_mm_text")
-            if not lon_ss_text:
-                missing_parts.append("lon_ss_text")
-            if not lon_dir_text:
-                missing_parts.append("lon_dir_text")
-
-            result = f"Missing parts: {', '.join(missing_parts)}"
+        print("Stopped watching, images in progress are processed on the next run.")
+        processor.close(terminate=True)
+
+def write_not_processed_file(errors):
+    """
+    Write the error lines of all images which could not be georeferenced to 'not_processed.txt',
+    an existing file is removed if there are no errors.
+
+    Args:
+    - errors (list): Error lines, one per failure.
+    """
+    if errors:
+        with open(error_file_path, "w") as file:
+            file.writelines(f"{error}\n" for error in errors)
+    elif os.path.exists(error_file_path):
+        os.remove(error_file_path)
+
+class StageTimer:
+    """
+    Wall time of the processing stages of one frame (read, decode, ocr, mask, ...).
+
+    If tracemalloc is tracing, the peak of the memory allocated by Python and
+    numpy within every stage is recorded as well. Stages must not be nested.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.peak_mb = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Time a stage, repeated stages of the same name are added up.
+
+        Args:
+        - name (str): Stage name.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            if tracing:
+                peak = (tracemalloc.get_traced_memory()[1] - current) / 2**20
+                self.peak_mb[name] = max(self.peak_mb.get(name, 0.0), peak)
+
+    def add(self, other, share=1.0):
+        """
+        Add the stages of another timer, e.g. a share of a stage run for a whole batch.
+
+        Args:
+        - other (StageTimer): Timer to add.
+        - share (float): Fraction of the time of the other timer.
+        """
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds * share
+        for name, peak in other.peak_mb.items():
+            self.peak_mb[name] = max(self.peak_mb.get(name, 0.0), peak)
+
+    def to_metrics(self, filename, status):
+        """
+        Build the metrics line of a frame, see MetricsLog.
+
+        Args:
+        - filename (str): Name of the PNG image.
+        - status (str): Status of the manifest record.
+
+        Returns:
+        - dict: Metrics of the frame.
+        """
+        metrics = {'type': 'frame', 'input': filename, 'status': status, 'pid': os.getpid(),
+                   'seconds': {name: round(seconds, 6) for name, seconds in self.seconds.items()},
+                   'total': round(sum(self.seconds.values()), 6), 'peak_rss_mb': peak_memory_mb()}
+        if self.peak_mb:
+            metrics['peak_mb'] = {name: round(peak, 3) for name, peak in self.peak_mb.items()}
+        return metrics
+
+def pop_frame_metrics():
+    """
+    Return and clear the stage timings collected in frame_metrics.
+
+    Returns:
+    - list: Metrics of the frames, see StageTimer.to_metrics().
+    """
+    metrics = frame_metrics[:]
+    frame_metrics.clear()
+    return metrics
+
+def peak_memory_mb():
+    """
+    Return the peak resident memory of this process.
+
+    Returns:
+    - float: Peak memory in MB, None if it is not available on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)
+    if os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                    ctypes.byref(counters), counters.cb):
+            return round(counters.PeakWorkingSetSize / 2**20, 1)
+    return None
+
+def percentile(values, q):
+    """
+    Return the q-th percentile of the values (nearest rank).
+
+    Args:
+    - values (list): Numbers.
+    - q (float): Percentile between 0 and 100.
+
+    Returns:
+    - float: Percentile, None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(np.ceil(q / 100 * len(ordered))) - 1))]
+
+class MetricsLog:
+    """
+    JSON-lines file with the stage timings of every frame ('frame' lines, see
+    StageTimer), of the stages run once per run like the KML ('stage' lines) and
+    a 'summary' line at the end. Lines are flushed as they are written, so the
+    file of an interrupted run is still complete up to the last batch.
+    """
+
+    def __init__(self, path, total=None):
+        """
+        Args:
+        - path (str): Path to the metrics file, it is replaced.
+        - total (int): Number of frames to process, None if unknown (watch mode).
+        """
+        self.path = path
+        self.total = total
+        self.frames = []
+        self.stages = {}
+        self.start = time.perf_counter()
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, entry):
+        """
+        Append a line to the metrics file.
+
+        Args:
+        - entry (dict): JSON serializable metrics.
+        """
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def add_frames(self, metrics):
+        """
+        Add the metrics of processed frames.
+
+        Args:
+        - metrics (list): Frame metrics, see StageTimer.to_metrics().
+        """
+        for entry in metrics:
+            self.frames.append(entry)
+            self.write(entry)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Time a stage which runs once for the whole run.
+
+        Args:
+        - name (str): Stage name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = time.perf_counter() - start
+            self.write({'type': 'stage', 'stage': name, 'seconds': round(self.stages[name], 6)})
+
+    def progress(self):
+        """
+        Return the throughput and the estimated remaining time as text.
+
+        Returns:
+        - str: e.g. '2.5 frames/s, ETA 0:01:20'.
+        """
+        elapsed = time.perf_counter() - self.start
+        fps = len(self.frames) / elapsed if elapsed else 0
+        text = f"{fps:.2f} frames/s"
+        if self.total and fps:
+            remaining = max(0, self.total - len(self.frames)) / fps
+            text += f", ETA {int(remaining // 3600)}:{int(remaining % 3600 // 60):02d}:{int(remaining % 60):02d}"
+        return text
+
+    def summary(self):
+        """
+        Write the summary line and close the file.
+
+        Returns:
+        - dict: Summary with frames, wall time, frames per second, the p50/p95
+          time of every stage in ms and the peak memory per process.
+        """
+        wall = time.perf_counter() - self.start
+        stages = {}
+        for entry in self.frames:
+            for name, seconds in entry['seconds'].items():
+                stages.setdefault(name, []).append(seconds)
+        peaks = {}
+        for entry in self.frames:
+            if entry.get('peak_rss_mb') is not None:
+                peaks[entry['pid']] = max(peaks.get(entry['pid'], 0), entry['peak_rss_mb'])
+        summary = {'type': 'summary', 'frames': len(self.frames), 'wall_s': round(wall, 3),
+                   'fps': round(len(self.frames) / wall, 3) if wall else None,
+                   'stages_ms': {name: {'p50': round(1000 * percentile(values, 50), 2),
+                                        'p95': round(1000 * percentile(values, 95), 2)}
+                                 for name, values in stages.items()},
+                   'once_ms': {name: round(1000 * seconds, 2) for name, seconds in self.stages.items()},
+                   'peak_rss_mb': max(peaks.values()) if peaks else None}
+        self.write(summary)
+        self.file.close()
+        return summary
+
+def video_creation_time(video_path):
+    """
+    Read the creation time from the movie header ('mvhd' box) of an MP4 or MOV video.
+
+    Args:
+    - video_path (str): Path to the video file.
+
+    Returns:
+    - datetime: Creation time in the local time zone of this computer, None if the
+      file has no movie header or no creation time.
+    """
+    with open(video_path, 'rb') as file:
+        position = 0
+        end = os.fstat(file.fileno()).st_size
+        path = [b'moov', b'mvhd']
+        while path and position + 8 <= end:
+            file.seek(position)
+            size, kind = struct.unpack('>I4s', file.read(8))
+            header = 8
+            if size == 1:
+                size = struct.unpack('>Q', file.read(8))[0]
+                header = 16
+            elif size == 0:
+                size = end - position
+            if size < header:
+                return None
+            if kind != path[0]:
+                position += size
+                continue
+            path.pop(0)
+            # Descend into the box
+            end = position + size
+            position += header
+        if path:
+            return None
+        file.seek(position)
+        version = file.read(4)[0]
+        seconds = struct.unpack('>Q', file.read(8))[0] if version == 1 else struct.unpack('>I', file.read(4))[0]
+    if not seconds:
+        return None
+    return (MP4_EPOCH + timedelta(seconds=seconds)).astimezone().replace(tzinfo=None)
+
+class VideoFrameReader:
+    """
+    Frames of a PUG video, decoded in memory instead of exported as PNG files.
+
+    A frame is sampled every interval seconds of video time. The frames in between
+    are still decoded (the video is read from start to end, without seeking), but
+    only the sampled frames are converted to BGR images. With the 'changed' sampling, a sampled frame is
+    only passed on if one of the coordinate boxes changed since the last passed
+    frame. The frames are named like the exported PNG files (iYYMMDD_HHMMSS-N.png)
+    after their time: the creation time of the video plus their position.
+    """
+
+    def __init__(self, video_path, interval=1.0, sample="interval", start_time=None):
+        """
+        Args:
+        - video_path (str): Path to the video file.
+        - interval (float): Seconds of video time between two sampled frames.
+        - sample (str): 'interval' passes every sampled frame, 'changed' only the
+          frames whose coordinate boxes changed.
+        - start_time (datetime): Time of the first frame, read from the video header if not given.
+
+        Raises:
+        - ValueError: If the video cannot be opened or its start time is unknown.
+        """
+        self.path = video_path
+        self.interval = interval
+        self.sample = sample
+        self.start_time = start_time or video_creation_time(video_path)
+        if self.start_time is None:
+            raise ValueError(f"The video {video_path} has no creation time, please give it with --video-start.")
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise ValueError(f"Error opening the video {video_path}.")
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        capture.release()
+        self.duration = frame_count / fps if fps > 0 and frame_count > 0 else None
+
+    def estimated_frames(self):
+        """
+        Return the expected number of frames passed on, None if unknown.
+        """
+        if self.duration is None or self.sample != "interval":
+            return None
+        return max(1, int(np.ceil(self.duration / self.interval)))
+
+    def hud_changed(self, crops, last_crops):
+        """
+        Check whether any coordinate box differs from the last passed frame by more than compression noise.
+        """
+        if last_crops is None:
+            return True
+        return any(cv2.absdiff(crops[name], last_crops[name]).mean() > HUD_CHANGE_THRESHOLD for name in crops)
+
+    def __iter__(self):
+        """
+        Decode the sampled frames.
+
+        Yields:
+        - tuple: (frame name, BGR image, position in ms, decode time in s)
+        """
+        capture = cv2.VideoCapture(self.path)
+        if not capture.isOpened():
+            raise ValueError(f"Error opening the video {self.path}.")
+        next_position = 0.0
+        last_crops = None
+        names = collections.Counter()
+        start = time.perf_counter()
+        try:
+            while capture.grab():
+                position = capture.get(cv2.CAP_PROP_POS_MSEC)
+                if position < next_position:
+                    continue
+                while next_position <= position:
+                    next_position += self.interval * 1000
+                success, img = capture.retrieve()
+                if not success:
+                    continue
+                if self.sample == "changed" and img.shape[:2] == (1080, 1920):
+                    crops = field_crops(img)
+                    if not self.hud_changed(crops, last_crops):
+                        continue
+                    last_crops = crops
+                stem = (self.start_time + timedelta(milliseconds=position)).strftime("i%y%m%d_%H%M%S")
+                name = f"{stem}-{names[stem]}.png"
+                names[stem] += 1
+                decode_time = time.perf_counter() - start
+                yield name, img, position, decode_time
+                start = time.perf_counter()
+        finally:
+            capture.release()
+
+def video_batches(video, manifest, batch_size, reprocess=False, image_paths=None):
+    """
+    Group the frames of a video into batches for process_batch(), frames which are
+    done according to the manifest are left out.
+
+    Args:
+    - video (VideoFrameReader): Frames of the video.
+    - manifest (RunManifest): Manifest of the run.
+    - batch_size (int): Maximum number of frames per batch.
+    - reprocess (bool): Also process the frames which are done.
+    - image_paths (list): Collects the frame paths of all frames of the video.
+
+    Yields:
+    - tuple: Batch, see RunManifest.batch().
+    """
+    frames = {}
+    for name, img, position, decode_time in video:
+        # Frame path below the video file, the manifest refers to the frame by its name
+        image_path = os.path.join(video.path, name)
+        if image_paths is not None:
+            image_paths.append(image_path)
+        if not reprocess and manifest.is_done(image_path):
+            continue
+        frames[image_path] = (img, position, decode_time)
+        if len(frames) == batch_size:
+            yield manifest.batch(list(frames), frames)
+            frames = {}
+    if frames:
+        yield manifest.batch(list(frames), frames)
+
+class RunManifest:
+    """
+    Record of the processed frames, a JSON lines file in the output directory.
+
+    Every processed frame appends one record with the input file name, size,
+    modification time and SHA-1 hash, the OCR results (text and score per
+    field), the lowest confidence, the output JPEG, the errors and the status
+    ('done', 'failed' or 'skipped'). The last record of a frame wins. A restarted
+    run skips the frames which are done and retries the failed ones.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+        - path (str): Path to the manifest file, loaded if it exists.
+        """
+        self.path = path
+        self.directory = os.path.dirname(path)
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line of an interrupted run
+                        continue
+                    self.records[record['input']] = record
+
+    def record(self, image_path):
+        """
+        Return the last record of an image, None if it was never processed.
+        """
+        return self.records.get(os.path.basename(image_path))
+
+    def is_done(self, image_path):
+        """
+        Check whether an image was processed without errors and did not change since.
+
+        Args:
+        - image_path (str): Path to the PNG image, or the frame path of a video frame.
+
+        Returns:
+        - bool: True if the image can be skipped.
+        """
+        record = self.record(image_path)
+        if record is None or record['status'] == 'failed':
+            return False
+        # Frames of a video have no file of their own
+        if record.get('video') is None:
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                return False
+            if (record['size'], record['mtime']) != (stat.st_size, stat.st_mtime_ns):
+                return False
+        return record['status'] == 'skipped' or os.path.exists(os.path.join(self.directory, record['output']))
+
+    def known_texts(self, image_path):
+        """
+        Return the OCR results of an image, if all fields were read in an earlier run.
+
+        Args:
+        - image_path (str): Path to the PNG image.
+
+        Returns:
+        - tuple: (input hash, field name -> [text, score]), None if not all fields are known.
+        """
+        record = self.record(image_path)
+        if record and record.get('input_hash') and len(record.get('texts', {})) == len(FIELDS):
+            return record['input_hash'], record['texts']
+        return None
+
+    def batch(self, image_paths, frames=None):
+        """
+        Build a batch for process_batch() with the known texts of the images.
+
+        Args:
+        - image_paths (list): Paths to the PNG images or frame paths of video frames.
+        - frames (dict): Frame path -> decoded video frame, see process_batch().
+
+        Returns:
+        - tuple: (image paths, image path -> known texts, frames)
+        """
+        known_texts = {image_path: self.known_texts(image_path) for image_path in image_paths}
+        return image_paths, {image_path: known for image_path, known in known_texts.items() if known}, frames or {}
+
+    def add(self, record):
+        """
+        Append a record to the manifest file.
+
+        Args:
+        - record (dict): Manifest record, see process_batch().
+        """
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + "\n")
+        self.records[record['input']] = record
+
+def save_processed_image(image_path, img, texts, timer=None):
+    """
+    Print the extracted coordinates, log missing parts and save the masked JPEG with EXIF metadata.
+
+    The already decoded image is masked in memory and encoded once as JPEG with
+    the EXIF block embedded, then written to the output directory in one operation.
+    The thumbnail is written from the same image if thumbnail_dir is set.
+
+    Args:
+    - image_path (str): Path to the PNG image.
+    - img (numpy.ndarray): The decoded BGR image, masked in place.
+    - texts (dict): Field name -> readtext()-like results, see recognize_fields().
+    - timer (StageTimer): Records the time of the mask, JPEG, EXIF, thumbnail and write stages.
+
+    Returns:
+    - tuple: (path of the written JPEG, None if the file name has no date and time; error lines for not_processed.txt)
+    """
+    errors = []
+    jpeg_path = None
+    timer = timer or StageTimer()
+    lat_dd_text = texts['lat_dd']
+    lat_mm_text = texts['lat_mm']
+    lat_ss_text = texts['lat_ss']
+    lat_dir_text = texts['lat_dir']
+    lon_dd_text = texts['lon_dd']
+    lon_mm_text = texts['lon_mm']
+    lon_ss_text = texts['lon_ss']
+    lon_dir_text = texts['lon_dir']
+
+    # print_extracted_text("Latitude DD", lat_dd_text)
+    # print_extracted_text("Latitude MM", lat_mm_text)
+    # print_extracted_text("Latitude SS", lat_ss_text)
+    # print_extracted_text("Latitude Direction", lat_dir_text)
+    # print_extracted_text("Longitude DD", lon_dd_text)
+    # print_extracted_text("Longitude MM", lon_mm_text)
+    # print_extracted_text("Longitude SS", lon_ss_text)
+    # print_extracted_text("Longitude Direction", lon_dir_text)
+
+    # Print the extracted text in the desired format
+    
+    #print(image_path)
+    if all([lat_dd_text, lat_mm_text, lat_ss_text, lat_dir_text]):
+        print(f"{lat_dd_text[0][1]} : {lat_mm_text[0][1]} : {lat_ss_text[0][1]}{lat_dir_text[0][1]}")
+    if all([lon_dd_text, lon_mm_text, lon_ss_text, lon_dir_text]):
+        print(f"{lon_dd_text[0][1]} : {lon_mm_text[0][1]} : {lon_ss_text[0][1]}{lon_dir_text[0][1]}")
+    print_lowest_confidence_score(lat_dd_text, lat_mm_text, lat_ss_text, lat_dir_text, 
+                              lon_dd_text, lon_mm_text, lon_ss_text, lon_dir_text)
+    print("")
+    print("*****************************************")
+
+    # Check if any text extraction results are empty
+    if not all([lat_dd_text, lat_mm_text, lat_ss_text, lat_dir_text, lon_dd_text, lon_mm_text, lon_ss_text, lon_dir_text]):
+        missing_parts = []
+        if not lat_dd_text:
+            missing_parts.append("lat_dd_text")
+        if not lat_mm_text:
+            missing_parts.append("lat_mm_text")
+        if not lat_ss_text:
+            missing_parts.append("lat_ss_text")
+        if not lat_dir_text:
+            missing_parts.append("lat_dir_text")
+        if not lon_dd_text:
+            missing_parts.append("lon_dd_text")
+        if not lon_mm_text:
+            missing_parts.append("lon_mm_text")
+        if not lon_ss_text:
+            missing_parts.append("lon_ss_text")
+        if not lon_dir_text:
+            missing_parts.append("lon_dir_text")
+
+        result = f"Missing parts: {', '.join(missing_parts)}"
+        print(f"{Fore.RED} FAILED ON: {image_path} - {result}{Style.RESET_ALL}\n")
+        errors.append(f"{image_path} - {result}")
+
+
+    filename = os.path.basename(image_path)
+    match = re.match(FILENAME_PATTERN, filename)
+    if match:
+        date_part, time_part = match.groups()
+        date_text = f"20{date_part[:2]} {date_part[2:4]} {date_part[4:6]}"
+        time_text_value = f"{time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}"
+
+
+        # print(f"YEAR: 20{date_part[:2]}")
+        # print(f"MONTH: {date_part[2:4]}")
+        # print(f"DAY: {date_part[4:6]}")
+        # print(f"Time: {time_text_value}")
+
+
+        lat = (lat_dd_text[0][1], lat_mm_text[0][1], lat_ss_text[0][1], lat_dir_text[0][1]) if all([lat_dd_text, lat_mm_text, lat_ss_text, lat_dir_text]) else None
+        lon = (lon_dd_text[0][1], lon_mm_text[0][1], lon_ss_text[0][1], lon_dir_text[0][1]) if all([lon_dd_text, lon_mm_text, lon_ss_text, lon_dir_text]) else None
+
+        # Apply mask, encode to jpeg and add the EXIF block in memory
+        jpeg_path = os.path.join(output_dir, filename.replace(".png", ".jpg"))
+        with timer.stage('mask'):
+            img = apply_mask(img)
+        with timer.stage('jpeg_encode'):
+            success, jpeg_buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not success:
+            raise ValueError(f"Error encoding the image {image_path} as JPEG.")
+        jpeg_data = jpeg_buffer.tobytes()
+        try:
+            with timer.stage('exif'):
+                jpeg_data = build_exif_jpeg(jpeg_data, date_text, time_text_value, lat, lon)
+            result = True
+        except Exception as e:
+            result = f"Error: {str(e)}"
+        thumbnail = None
+        if thumbnail_dir:
+            with timer.stage('thumbnail'):
+                thumbnail = create_thumbnail(img)
+        with timer.stage('write'):
+            write_file(jpeg_path, jpeg_data)
+            if thumbnail is not None:
+                write_file(os.path.join(thumbnail_dir, os.path.basename(jpeg_path)), thumbnail)
+
+        if result is not True:
             print(f"{Fore.RED} FAILED ON: {image_path} - {result}{Style.RESET_ALL}\n")
-            with open(error_file_path, "a") as file:
-                file.write(f"{image_path} - {result}\n")
-
-
-        filename = os.path.basename(image_path)
-        match = re.match(r'i(\d{6})_(\d{6})-\d+\.png', filename)
-        if match:
-            date_part, time_part = match.groups()
-            date_text = f"20{date_part[:2]} {date_part[2:4]} {date_part[4:6]}"
-            time_text_value = f"{time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}"
-
-
-            # print(f"YEAR: 20{date_part[:2]}")
-            # print(f"MONTH: {date_part[2:4]}")
-            # print(f"DAY: {date_part[4:6]}")
-            # print(f"Time: {time_text_value}")
-
-
-            # Open ans export to jpeg
-            jpeg_path = os.path.join(output_dir, filename.replace(".png", ".jpg"))
-            im = Image.open(image_path)
-            im.save(jpeg_path) 
-            
-            #Apply mask
-            apply_and_save_mask(jpeg_path)
-            
-            lat = (lat_dd_text[0][1], lat_mm_text[0][1], lat_ss_text[0][1], lat_dir_text[0][1]) if all([lat_dd_text, lat_mm_text, lat_ss_text, lat_dir_text]) else None
-            lon = (lon_dd_text[0][1], lon_mm_text[0][1], lon_ss_text[0][1], lon_dir_text[0][1]) if all([lon_dd_text, lon_mm_text, lon_ss_text, lon_dir_text]) else None
-            result = add_exif_information(jpeg_path, date_text, time_text_value,  lat, lon)
-
-            if result is not True:
-                print(f"{Fore.RED} FAILED ON: {image_path} - {result}{Style.RESET_ALL}\n")
-                with open(error_file_path, "a") as file:
-                    file.write(f"{image_path} - Missing parts: {result}\n")
-        else:
-            print(f"Filename {filename} does not match expected format.")
+            errors.append(f"{image_path} - Missing parts: {result}")
+    else:
+        print(f"Filename {filename} does not match expected format.")
+    return jpeg_path, errors
+
+def parse_arguments():
+    """
+    Parse the command line options. Directories which are not given are asked for interactively.
+
+    Returns:
+    - argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Process PUG images: extract coordinates, apply mask and create a KML preview.")
+    parser.add_argument("--input", help="Input directory containing the PNG images.")
+    parser.add_argument("--output", help="Output directory for the processed images and the KML file.")
+    parser.add_argument("--video",
+                        help="Read the frames from this video file instead of PNG images in the input directory.")
+    parser.add_argument("--frame-interval", type=float, default=1.0,
+                        help="Seconds of video time between two frames sampled from --video (default: 1).")
+    parser.add_argument("--sample", choices=["interval", "changed"], default="interval",
+                        help="'interval' processes every sampled video frame, 'changed' only the frames whose "
+                             "coordinates changed since the last processed frame (default: interval).")
+    parser.add_argument("--video-start",
+                        help="Local time of the first video frame (YYYY-MM-DD HH:MM:SS), "
+                             "default: the creation time in the MP4/MOV header.")
+    parser.add_argument("--mask", help="Path to pgu_mask.png (default: current directory).")
+    parser.add_argument("--ocr-mode", choices=["recognize", "detect", "template"], default="recognize",
+                        help="'recognize' reads the fixed HUD boxes without text detection (fast), "
+                             "'detect' runs the full EasyOCR detection on every box, "
+                             "'template' reads the boxes with glyph templates and uses EasyOCR only for "
+                             "low confidence boxes (fastest, learns the templates on the first run) (default: recognize).")
+    parser.add_argument("--glyphs", default="pug_glyphs.npz",
+                        help="Glyph templates file of the 'template' OCR mode (default: pug_glyphs.npz).")
+    parser.add_argument("--template-threshold", type=float, default=0.90,
+                        help="Template score below which a box is read by EasyOCR (default: 0.90).")
+    parser.add_argument("--escalation-threshold", type=float, default=0.90,
+                        help="EasyOCR score below which a box is read a second time with more expensive settings: "
+                             "an enhanced crop, or in 'detect' mode the full readtext() settings after a cheap "
+                             "first pass. 0 reads every box once, in 'detect' mode with the full settings (default: 0.90).")
+    parser.add_argument("--no-ocr-cache", action="store_true",
+                        help="Run the OCR on every box, even if its pixels did not change since an earlier frame.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and process new PNG images as they arrive in the input directory, "
+                             "pug_preview.kml is updated after every batch. Stop with Ctrl+C.")
+    parser.add_argument("--poll-interval", type=float, default=5,
+                        help="Seconds between two scans of the input directory in --watch mode (default: 5).")
+    parser.add_argument("--reprocess", action="store_true",
+                        help=f"Process all images again, also the ones already done according to {MANIFEST_NAME} in the output directory.")
+    parser.add_argument("--kml-mode", choices=["full", "thumbnail", "kmz"], default="full",
+                        help="'full' embeds the full resolution JPEG files into pug_preview.kml, "
+                             "'thumbnail' embeds small preview thumbnails, "
+                             "'kmz' packs pug_preview.kml and the thumbnails into pug_preview.kmz (default: full).")
+    parser.add_argument("--metrics",
+                        help="JSON-lines file for the stage timings of every frame (default: pug_metrics.jsonl in the output directory).")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record the peak memory of every stage with tracemalloc, slows down the processing.")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run the resident OCR service: load the model once and read the boxes for the "
+                             "processing runs started later on this machine. Stop with Ctrl+C.")
+    parser.add_argument("--no-ocr-service", action="store_true",
+                        help="Load the OCR model in this run, even if the OCR service is running.")
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="Number of images read by the recognizer in one batch. Lower values need less memory (default: 16).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes, each loads its own OCR model (default: 1, no process pool).")
+    return parser.parse_args()
 
 def main():
+    args = parse_arguments()
     # Initialize colorama for cross-platform compatibility for color
     init()
-    reader = easyocr.Reader(['en'], gpu=False, model_storage_directory='model\\')
     global output_dir  # Declare the global variable
     global mask_path  # Declare the global variable
     global error_file_path  # Declare the global variable
+    global glyph_recognizer, template_threshold, ocr_cache, thumbnail_dir, escalation_threshold
     
     error_file_path="not_processed.txt"
 
-    if os.path.exists(error_file_path):
-        os.remove(error_file_path)
+    if args.serve:
+        serve_ocr()
+        return
+    if args.video and args.watch:
+        raise ValueError("--video cannot be combined with --watch.")
 
-    print("")
-    print("Enter the input directory path:")
-    print("Example: /path/to/your/images (Linux/Mac) or C:\\Path\\To\\Your\\Images (Windows)")
-    image_dir = input("> ")
+    image_dir = args.input
+    if not image_dir and not args.video:
+        print("")
+        print("Enter the input directory path:")
+        print("Example: /path/to/your/images (Linux/Mac) or C:\\Path\\To\\Your\\Images (Windows)")
+        image_dir = input("> ")
 
-    print("")
-    print("Enter the output directory path:")
-    print("Example: /path/to/your/output (Linux/Mac) or C:\\Path\\To\\Your\\Output (Windows)")
-    output_dir = input("> ")
+    output_dir = args.output
+    if not output_dir:
+        print("")
+        print("Enter the output directory path:")
+        print("Example: /path/to/your/output (Linux/Mac) or C:\\Path\\To\\Your\\Output (Windows)")
+        output_dir = input("> ")
 
     # Check if the mask file exists in the current directory
-    mask_path = "pgu_mask.png"
+    mask_path = args.mask or "pgu_mask.png"
     if not os.path.exists(mask_path):
         print("")
         print(f"{Fore.RED}pgu_mask.png not found in the current directory.{Style.RESET_ALL}")
@@ -503,33 +2429,138 @@ def main():
             raise ValueError(f"Mask file not found at the specified path: {mask_path}")
 
 
-    image_dir = os.path.normpath(image_dir)
     output_dir = os.path.normpath(output_dir)
 
-    pattern = os.path.join(image_dir, "*.png")
-
-    image_files = glob.glob(pattern)
-    total_images = len(image_files)
-
-    image_count = 1
-
-    for filename in os.listdir(image_dir):
-        if filename.endswith(".png"):
-            image_path = os.path.join(image_dir, filename)
-            # image_path ="/media/menas/data/projects/pngtojpg/PGU_TI_sani/i240630_122337-0.png"
-            print(f"Processing {image_path} : {image_count} of {total_images}")
-            process_image(image_path, reader)
-    
-            image_count += 1
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = RunManifest(os.path.join(output_dir, MANIFEST_NAME))
+
+    batch_size = max(1, args.batch_size)
+    workers = max(1, args.workers)
+    if args.video:
+        # The frames are decoded while the batches are submitted, image_files grows with them
+        start_time = datetime.strptime(args.video_start, "%Y-%m-%d %H:%M:%S") if args.video_start else None
+        video = VideoFrameReader(os.path.normpath(args.video), args.frame_interval, args.sample, start_time)
+        print(f"Reading {video.path}, first frame at {video.start_time}")
+        image_files = []
+        batches = video_batches(video, manifest, batch_size, args.reprocess, image_files)
+        total_images = video.estimated_frames()
+    else:
+        image_dir = os.path.normpath(image_dir)
+        image_files = sorted(os.path.join(image_dir, filename) for filename in os.listdir(image_dir) if filename.endswith(".png"))
+        todo_files = image_files if args.reprocess else [image_path for image_path in image_files if not manifest.is_done(image_path)]
+        if len(todo_files) < len(image_files):
+            print(f"{len(image_files) - len(todo_files)} of {len(image_files)} images already processed, see {manifest.path}")
+        total_images = len(todo_files)
+        batches = [manifest.batch(todo_files[start:start + batch_size]) for start in range(0, total_images, batch_size)]
+    glyph_recognizer = GlyphRecognizer(args.glyphs)
+    template_threshold = args.template_threshold
+    escalation_threshold = args.escalation_threshold
+    ocr_cache = None if args.no_ocr_cache else OcrCache()
+    if args.kml_mode != "full":
+        thumbnail_dir = os.path.join(output_dir, THUMBNAIL_DIR)
+        os.makedirs(thumbnail_dir, exist_ok=True)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    metrics = MetricsLog(args.metrics or os.path.join(output_dir, "pug_metrics.jsonl"), None if args.watch else total_images)
+
+    image_count = 0
+    kml_file_path = os.path.join(output_dir, "pug_preview.kmz" if args.kml_mode == "kmz" else "pug_preview.kml")
+    preview_kml = None
+    if args.watch:
+        # Placemarks of the images done in earlier runs, new images are added as they are processed.
+        # The KML links the images, a KMZ is only packed when watching stops
+        preview_kml = PreviewKml(os.path.join(output_dir, "pug_preview.kml"), output_dir, args.kml_mode)
+        for image_path in image_files:
+            if manifest.is_done(image_path):
+                preview_kml.add(manifest.record(image_path))
+
+    def handle_result(result):
+        nonlocal image_count
+        image_count += result['count']
+        metrics.add_frames(result['metrics'])
+        print(result['output'], end="")
+        print(f"Processed {image_count} images ({metrics.progress()})" if args.watch or not total_images
+              else f"Processed {image_count} of {total_images} ({metrics.progress()})")
+        for record in result['records']:
+            manifest.add(record)
+            if preview_kml is not None:
+                preview_kml.add(record)
+        ocr_stats.update(result['stats'])
+        glyph_recognizer.add(result['glyphs'])
+        if preview_kml is not None:
+            preview_kml.write()
+
+    # Each worker loads the model once, at most one batch per worker is in flight
+    use_ocr_service = not args.no_ocr_service
+    if use_ocr_service:
+        client = OcrServiceClient.connect()
+        if client is not None:
+            client.connection.close()
+            print(f"Using the running OCR service, see {OCR_SERVICE_FILE}")
+        else:
+            use_ocr_service = False
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    processor = BatchProcessor(workers, args.ocr_mode,
+                               (output_dir, mask_path, args.ocr_mode, threads,
+                                args.glyphs, args.template_threshold, not args.no_ocr_cache, thumbnail_dir,
+                                args.trace_memory, use_ocr_service, args.escalation_threshold), use_ocr_service)
+    if args.watch:
+        watch_directory(image_dir, manifest, processor, handle_result, batch_size, args.poll_interval)
+        image_files = sorted(os.path.join(image_dir, filename) for filename in os.listdir(image_dir) if filename.endswith(".png"))
+    else:
+        # Batches are taken one by one, video frames are only decoded when a worker is free
+        pending = iter(batches)
+        batch = next(pending, None)
+        while batch is not None or processor.in_flight:
+            while batch is not None and processor.has_capacity():
+                processor.submit(batch)
+                batch = next(pending, None)
+            for result in processor.collect(wait=True):
+                handle_result(result)
+        processor.close()
+
+    # Errors of all images, also of the ones processed in earlier runs
+    errors = [error for image_path in image_files for error in (manifest.record(image_path) or {}).get('errors', [])]
+    write_not_processed_file(errors)
+    if args.ocr_mode == "template" and glyph_recognizer.changed:
+        glyph_recognizer.save(args.glyphs)
     print("")
     print("Results:")
-    # Create KML
-    extract_exif_and_create_kml(output_dir, os.path.join(output_dir,"pug_preview.kml"))
+    # Create KML from the coordinates in the manifest
+    with metrics.stage('kml'):
+        if preview_kml is not None:
+            preview_kml.write()
+            print(f"- KML file created at {preview_kml.kml_file_path}")
+        if preview_kml is None or args.kml_mode == "kmz":
+            write_preview_kml(kml_file_path, [manifest.record(image_path) for image_path in image_files], output_dir, args.kml_mode)
+            print(f"- KML file created at {kml_file_path}")
     print(f"- JPEG files with GEOTAG and TIME path: {output_dir}")
+    if args.ocr_mode == "template":
+        print(f"- {ocr_stats['template']} boxes read by glyph templates, {ocr_stats['easyocr_fallback']} by EasyOCR")
+    if escalation_threshold and ocr_stats['first_pass']:
+        print(f"- {ocr_stats['escalated']} of {ocr_stats['first_pass']} boxes read by EasyOCR scored below "
+              f"{escalation_threshold:.2f} and were read a second time")
+    if ocr_stats['manifest_reuse']:
+        print(f"- OCR results of {ocr_stats['manifest_reuse']} unchanged images reused from {MANIFEST_NAME}")
+    cache_lookups = ocr_stats['cache_hit'] + ocr_stats['cache_miss']
+    if cache_lookups:
+        print(f"- OCR cache: {ocr_stats['cache_hit']} of {cache_lookups} boxes reused unchanged crops "
+              f"(hit rate {ocr_stats['cache_hit'] / cache_lookups:.0%})")
+    summary = metrics.summary()
+    if summary['frames']:
+        print(f"- {summary['frames']} frames in {summary['wall_s']:.1f} s ({summary['fps']:.2f} frames/s), "
+              f"stage timings in {metrics.path}:")
+        for name, timing in summary['stages_ms'].items():
+            print(f"    {name:<12} p50 {timing['p50']:>8.1f} ms   p95 {timing['p95']:>8.1f} ms")
+        if summary['peak_rss_mb']:
+            print(f"    peak memory per process {summary['peak_rss_mb']:.0f} MB")
     # Check number of non processed files
     check_not_processed_file()
     
     
 
 if __name__ == "__main__":
+    # Needed for the process pool in the PyInstaller executable
+    multiprocessing.freeze_support()
     main()
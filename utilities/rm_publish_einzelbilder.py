@@ -6,8 +6,16 @@ Version:
 1.0 initial Version
 1.1  fixed missing KML Header info
 1.2  added check for missing gps tags
+1.3  read image size and EXIF from the JPEG headers instead of gdalinfo
+1.4  thumbnails are generated in parallel from the reduced resolution JPEG overviews
+1.5  metadata and thumbnail status cached in a manifest, reruns only process new or changed images
+1.6  input directory listed only once, all steps use the same sorted inventory
+1.7  optional regionated KML/KMZ with one tile per quadtree node for large items
+1.8  image catalog as GeoJSON sequence sorted along a Hilbert curve
+1.9  optional upload of the item to a directory or S3 compatible storage, unchanged files are skipped
+2.0  batch mode (--batch) publishing several items at the same time without prompts
 """
-version= 1.2
+version= 2.0
 """
 Author: David Oesch
 Description:
@@ -24,25 +32,100 @@ import os
 import subprocess
 import json
 import re
+import argparse
+import struct
+import concurrent.futures
+import io
+import shutil
+import zipfile
+import base64
+import datetime
+import hashlib
+import hmac
+import http.client
+import random
+import socket
+import threading
+import time
+import urllib.parse
+from xml.etree import ElementTree
 print("Version: "+str(version))
 
 #Fix RM-PublishEinzelbilder.py
 
 max_width = 640
 max_height = 480 
+# Number of thumbnails generated at the same time, one gdal_translate per core
+thumbnail_workers = os.cpu_count() or 1
+# Metadata of the images of earlier runs, stored in the input directory
+MANIFEST_FILE = "rm_publish_manifest.json"
 COLLECTION="https://data.geo.admin.ch/ch.swisstopo.rapidmapping/data/"
+# Products: option, icon URL, icon scale, product type used in the file names
+PRODUCTS = {
+    "SENKRECHT": ("Einzelbilder SENKRECHT", "https://map.geo.admin.ch/api/icons/sets/default/icons/008-circle-stroked@1x-255,0,0.png", 0.25, "SENKRECHT"),
+    "SCHRAEG": ("Einzelbilder SCHRAEG", "https://map.geo.admin.ch/api/icons/sets/default/icons/100-camera@1x-127,0,255.png", 0.75, "SCHRAEGAUFNAHMEN"),
+}
+KML_MODES = ("single", "regionated", "kmz")
+# Regionated KML: placemarks per tile, size of a tile on screen before it is loaded and maximum depth of the quadtree
+KML_TILE_SIZE = 500
+KML_MIN_LOD_PIXELS = 128
+KML_MAX_DEPTH = 12
+# Resolution of the Hilbert curve used to sort the catalog (2^order cells per axis)
+HILBERT_ORDER = 16
+# Upload: files at the same time, attempts per request, wait before the first retry in seconds,
+# files larger than the threshold are uploaded in parts
+UPLOAD_WORKERS = 8
+UPLOAD_RETRIES = 5
+UPLOAD_BACKOFF = 1.0
+UPLOAD_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+UPLOAD_PART_SIZE = 16 * 1024 * 1024
+
+# JPEG start of frame markers (baseline, progressive, ...), they hold the image size
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# JPEG markers without length field
+STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+# TIFF field types used by EXIF: type -> (struct format, size)
+TIFF_TYPES = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('I', 4), 5: ('II', 8), 7: ('B', 1), 9: ('i', 4), 10: ('ii', 8)}
+# EXIF tags: pointers to the EXIF and GPS IFD, DateTimeOriginal and the GPS position
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_GPS_LATITUDE_REF, TAG_GPS_LATITUDE, TAG_GPS_LONGITUDE_REF, TAG_GPS_LONGITUDE = 1, 2, 3, 4
 
 def prompt_choice():
     """Check for Valid Product input"""
     choice = input("Please enter your choice\n1) for Einzelbilder SENKRECHT\n2) for Einzelbilder SCHRAEG \n-> ")
     if choice == '1':
-        return "Einzelbilder SENKRECHT", "https://map.geo.admin.ch/api/icons/sets/default/icons/008-circle-stroked@1x-255,0,0.png", 0.25, "SENKRECHT"
+        return "SENKRECHT"
     elif choice == '2':
-        return "Einzelbilder SCHRAEG", "https://map.geo.admin.ch/api/icons/sets/default/icons/100-camera@1x-127,0,255.png", 0.75, "SCHRAEGAUFNAHMEN"
+        return "SCHRAEG"
     else:
         print("Invalid choice. Please enter 1 or 2.")
         return prompt_choice()
 
+def prompt_kml_mode():
+    """Check for Valid KML mode input"""
+    choice = input("Please enter the KML type (Enter for 1)\n1) single KML\n2) regionated KML (for many images)\n3) regionated KMZ (for many images)\n-> ")
+    if choice in ('', '1'):
+        return "single"
+    elif choice == '2':
+        return "regionated"
+    elif choice == '3':
+        return "kmz"
+    else:
+        print("Invalid choice. Please enter 1, 2 or 3.")
+        return prompt_kml_mode()
+
+def prompt_upload_target():
+    """Upload target of the item: directory, s3://bucket/prefix or empty to skip the upload"""
+    print("\nPlease enter the UPLOAD target of the data collection, Enter to skip the upload")
+    print("Example: '\\\\server\\bgdiscratch\\data' or 's3://bucket/data'")
+    target = input("-> ").strip()
+    if target and not target.startswith("s3://") and not check_directory_exists(target):
+        print(f"The directory '{target}' does not exist. Please enter a valid directory.")
+        return prompt_upload_target()
+    return target
+
 def check_directory_exists(directory):
     """Check if the given directory exists."""
     return os.path.isdir(directory)
@@ -59,6 +142,12 @@ def check_item_name(item_name):
     else:
         return False
 
+def make_item(item_name, product):
+    """Names and styling of an item, used by all output files."""
+    option, icon_url, icon_scale, product_type = PRODUCTS[product]
+    return {'name': item_name, 'option': option, 'icon_url': icon_url, 'icon_scale': icon_scale,
+            'product_type': product_type, 'base_url': COLLECTION+item_name+"/"}
+
 def dms_to_decimal(degrees, minutes, seconds, direction):
     """Convert DMS (Degrees, Minutes, Seconds) to decimal format."""
     decimal = degrees + minutes / 60 + seconds / 3600
@@ -69,58 +158,91 @@ def dms_to_decimal(degrees, minutes, seconds, direction):
     decimal = round(decimal, 6)
     return decimal
 
-def resize_images(input_dir, output_dir, max_width, max_height,image_count):
-    """Resize images maintaining aspect ratio."""
-    os.makedirs(output_dir, exist_ok=True)
-    count=1
-    for filename in os.listdir(input_dir):
-        file_path = os.path.join(input_dir, filename)
-        if os.path.isfile(file_path) and filename.lower().endswith(('.jpg', '.jpeg')):
-            print("Step 1: generating thumbnail for image "+str(count)+" of "+str(image_count)+" "+filename  )
-            thumbnail_path = os.path.join(output_dir, filename)
-            
-            
-            # Bilddimensionen auslesen
-            with open(os.devnull, 'w') as devnull:
-                gdalinfo_output = subprocess.run(
-                    ['gdalinfo', '-json', file_path],
-                    capture_output=True, text=True
-                )
-            
-            image_info = json.loads(gdalinfo_output.stdout)
-            width = int(image_info['size'][0])
-            height = int(image_info['size'][1])
-            
-            # Berechnung der neuen Dimensionen unter Beibehaltung des Seitenverhältnisses
-            aspect_ratio = width / height
-            if aspect_ratio > 1:
-                new_width = min(max_width, width)
-                new_height = int(new_width / aspect_ratio)
-            else:
-                new_height = min(max_height, height)
-                new_width = int(new_height * aspect_ratio)
-
-            new_width = min(new_width, max_width)
-            new_height = min(new_height, max_height)
-
-            # Unterdrücken der Ausgaben und Setzen der Umgebungsvariable GDAL_PAM_ENABLED=NO
-            with open(os.devnull, 'w') as devnull:
-                subprocess.run(
-                    ['gdal_translate', '-of', 'JPEG', '-outsize', str(new_width), str(new_height), file_path, thumbnail_path],
-                    stdout=devnull,
-                    stderr=devnull,
-                    env={**os.environ, 'GDAL_PAM_ENABLED': 'NO'}
-                )
-            count=count+1
+def read_ifd(tiff, offset, byte_order):
+    """Read the entries of an IFD of the TIFF block of an EXIF segment as tag -> value."""
+    entries = {}
+    count = struct.unpack_from(byte_order + 'H', tiff, offset)[0]
+    for i in range(count):
+        tag, field_type, value_count, value = struct.unpack_from(byte_order + 'HHI4s', tiff, offset + 2 + 12 * i)
+        if field_type not in TIFF_TYPES:
+            continue
+        fmt, size = TIFF_TYPES[field_type]
+        # Values of more than 4 bytes are stored at an offset
+        if size * value_count > 4:
+            value_offset = struct.unpack(byte_order + 'I', value)[0]
+            value = tiff[value_offset:value_offset + size * value_count]
+            if len(value) < size * value_count:
+                raise ValueError("EXIF value outside of the segment")
+        if field_type == 2:
+            entries[tag] = value[:value_count].split(b'\0')[0].decode('ascii', 'replace')
+        elif field_type in (5, 10):
+            numbers = struct.unpack_from(byte_order + fmt[0] * 2 * value_count, value)
+            entries[tag] = [numbers[j] / numbers[j + 1] if numbers[j + 1] else 0.0 for j in range(0, len(numbers), 2)]
+        else:
+            entries[tag] = list(struct.unpack_from(byte_order + fmt * value_count, value))
+    return entries
 
-def extract_exif(file_path):
-    """Extract EXIF data from images."""
+def parse_exif(segment):
+    """Get GPS position and DateTimeOriginal from the TIFF block of an APP1/EXIF segment."""
+    byte_order = {b'II': '<', b'MM': '>'}.get(segment[:2])
+    if byte_order is None:
+        raise ValueError("Invalid EXIF byte order")
+    ifd0 = read_ifd(segment, struct.unpack_from(byte_order + 'I', segment, 4)[0], byte_order)
+
+    lat, lon = None, None
+    timestamp = None
+    if TAG_EXIF_IFD in ifd0:
+        exif = read_ifd(segment, ifd0[TAG_EXIF_IFD][0], byte_order)
+        timestamp = exif.get(TAG_DATETIME_ORIGINAL)
+    if TAG_GPS_IFD in ifd0:
+        gps = read_ifd(segment, ifd0[TAG_GPS_IFD][0], byte_order)
+        if len(gps.get(TAG_GPS_LATITUDE, [])) == 3 and len(gps.get(TAG_GPS_LONGITUDE, [])) == 3:
+            lat = dms_to_decimal(*gps[TAG_GPS_LATITUDE], gps.get(TAG_GPS_LATITUDE_REF, 'N'))
+            lon = dms_to_decimal(*gps[TAG_GPS_LONGITUDE], gps.get(TAG_GPS_LONGITUDE_REF, 'E'))
+    return lat, lon, timestamp
+
+def read_jpeg_metadata(file_path):
+    """
+    Read image size, GPS position and DateTimeOriginal directly from the JPEG headers.
+    Only the segments up to the start of frame (SOF) are read, usually the first few KB.
+    """
+    metadata = {'width': None, 'height': None, 'lat': None, 'lon': None, 'timestamp': None}
+    with open(file_path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            raise ValueError("Not a JPEG file")
+        while True:
+            byte = f.read(1)
+            if not byte:
+                raise ValueError("No start of frame found")
+            if byte != b'\xff':
+                continue
+            marker = f.read(1)
+            # Fill bytes before a marker
+            while marker == b'\xff':
+                marker = f.read(1)
+            if not marker:
+                raise ValueError("No start of frame found")
+            marker = marker[0]
+            if marker in STANDALONE_MARKERS or marker == 0x00:
+                continue
+            length = struct.unpack('>H', f.read(2))[0]
+            if marker in SOF_MARKERS:
+                metadata['height'], metadata['width'] = struct.unpack('>xHH', f.read(5))
+                return metadata
+            segment = f.read(length - 2)
+            if marker == 0xE1 and segment.startswith(b'Exif\0\0'):
+                metadata['lat'], metadata['lon'], metadata['timestamp'] = parse_exif(segment[6:])
+            elif marker == 0xDA:
+                raise ValueError("No start of frame found")
+
+def read_gdalinfo_metadata(file_path):
+    """Read image size, GPS position and DateTimeOriginal with gdalinfo."""
     with open(os.devnull, 'w') as devnull:
         gdalinfo_output = subprocess.run(['gdalinfo', '-json', file_path], capture_output=True, text=True)
     exif_data = json.loads(gdalinfo_output.stdout)
     
-    lat, lon = None, None
-    timestamp = None
+    metadata = {'width': int(exif_data['size'][0]), 'height': int(exif_data['size'][1]),
+                'lat': None, 'lon': None, 'timestamp': None}
     if 'metadata' in exif_data and '' in exif_data['metadata']:
         exif = exif_data['metadata']['']
 
@@ -134,79 +256,715 @@ def extract_exif(file_path):
             lat_degrees, lat_minutes, lat_seconds = [float(x.replace(')', '')) for x in lat_parts.strip('()').split(') (')]
             lon_degrees, lon_minutes, lon_seconds = [float(x.replace(')', '')) for x in lon_parts.strip('()').split(') (')]
             
-            lat = dms_to_decimal(lat_degrees, lat_minutes, lat_seconds, lat_ref)
-            lon = dms_to_decimal(lon_degrees, lon_minutes, lon_seconds, lon_ref)
+            metadata['lat'] = dms_to_decimal(lat_degrees, lat_minutes, lat_seconds, lat_ref)
+            metadata['lon'] = dms_to_decimal(lon_degrees, lon_minutes, lon_seconds, lon_ref)
         
         if 'EXIF_DateTimeOriginal' in exif:
-            timestamp = exif['EXIF_DateTimeOriginal']
+            metadata['timestamp'] = exif['EXIF_DateTimeOriginal']
 
-    return lat, lon, timestamp
+    return metadata
+
+def read_image_metadata(file_path):
+    """
+    Read image size, GPS position and DateTimeOriginal of an image.
+    The JPEG headers are parsed in Python, gdalinfo is only started if that fails.
+    """
+    try:
+        return read_jpeg_metadata(file_path)
+    except (ValueError, struct.error) as e:
+        print(f"JPEG header of {file_path} not readable ({e}), using gdalinfo")
+        return read_gdalinfo_metadata(file_path)
+
+def get_thumbnail_size(width, height, max_width, max_height):
+    """Size of the thumbnail maintaining the aspect ratio."""
+    aspect_ratio = width / height
+    if aspect_ratio > 1:
+        new_width = min(max_width, width)
+        new_height = int(new_width / aspect_ratio)
+    else:
+        new_height = min(max_height, height)
+        new_width = int(new_height * aspect_ratio)
+
+    return min(new_width, max_width), min(new_height, max_height)
+
+def get_overview_level(width, height, new_width, new_height):
+    """
+    Smallest JPEG overview still larger than the thumbnail.
+    The GDAL JPEG driver decodes its overviews (1/2, 1/4, 1/8) directly at reduced resolution
+    with the DCT scaling of libjpeg, so the full resolution image is never decoded.
+    Returns the index for gdal_translate -ovr, or None for the full resolution.
+    """
+    for level in (2, 1, 0):
+        factor = 2 << level
+        # The driver only offers the overview if the image is at least 256 pixels at this level
+        if max(width, height) < (256 << level):
+            continue
+        if width // factor >= new_width and height // factor >= new_height:
+            return level
+    return None
+
+def load_manifest(input_dir):
+    """Load the records of the images of an earlier run, filename -> record."""
+    manifest_path = os.path.join(input_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-def generate_kml(input_dir, kml_file,image_count):
+def save_manifest(input_dir, manifest):
+    """Save the records of the images, the old manifest is only replaced once the new one is complete."""
+    manifest_path = os.path.join(input_dir, MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def list_files(directory):
+    """Names of the files in a directory with their stat, in one listing of the directory."""
+    if not os.path.isdir(directory):
+        return {}
+    with os.scandir(directory) as entries:
+        return {entry.name: entry.stat() for entry in entries if entry.is_file()}
+
+def update_manifest(input_dir, manifest, executor):
+    """
+    Inventory of the images of the input directory, sorted by filename.
+    The directory is listed once, the metadata is only read for new or changed images
+    (other size or modification time), in the threads of the executor. Removed images are dropped.
+    """
+    records = {}
+    changed = []
+    for filename, stat in sorted(list_files(input_dir).items()):
+        if filename.lower().endswith(('.jpg', '.jpeg')):
+            record = manifest.get(filename)
+            if (record is None or record['size'] != stat.st_size or record['mtime'] != stat.st_mtime_ns
+                    or 'gps' not in record):
+                print("Step 0: reading metadata of new or changed image "+filename)
+                record = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+                changed.append(filename)
+            records[filename] = record
+
+    paths = [os.path.join(input_dir, filename) for filename in changed]
+    for filename, metadata in zip(changed, executor.map(read_image_metadata, paths)):
+        records[filename].update(metadata)
+        records[filename]['gps'] = metadata['lat'] is not None and metadata['lon'] is not None
+        records[filename]['thumbnail'] = False
+    return records
+
+def create_thumbnail(file_path, thumbnail_path, width, height, max_width, max_height):
+    """Generate the thumbnail of one image with gdal_translate, returns True if it was written."""
+    # Berechnung der neuen Dimensionen unter Beibehaltung des Seitenverhältnisses
+    new_width, new_height = get_thumbnail_size(width, height, max_width, max_height)
+
+    command = ['gdal_translate', '-of', 'JPEG', '-outsize', str(new_width), str(new_height)]
+    overview_level = get_overview_level(width, height, new_width, new_height)
+    if overview_level is not None:
+        command += ['-ovr', str(overview_level)]
+
+    # Unterdrücken der Ausgaben und Setzen der Umgebungsvariable GDAL_PAM_ENABLED=NO
+    with open(os.devnull, 'w') as devnull:
+        result = subprocess.run(
+            command + [file_path, thumbnail_path],
+            stdout=devnull,
+            stderr=devnull,
+            env={**os.environ, 'GDAL_PAM_ENABLED': 'NO'}
+        )
+    return result.returncode == 0 and os.path.isfile(thumbnail_path)
+
+def resize_images(input_dir, output_dir, max_width, max_height, manifest, executor):
+    """
+    Resize images maintaining aspect ratio, in the threads of the executor (one per core).
+    Thumbnails of unchanged images are kept.
+    """
+    thumbnails = list_files(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    pending = [filename for filename, record in manifest.items()
+               if not record['thumbnail'] or filename not in thumbnails]
+    print("Step 1: "+str(len(manifest) - len(pending))+" of "+str(len(manifest))+" thumbnails are up to date")
+
+    count=1
+    futures = {}
+    for filename in pending:
+        record = manifest[filename]
+        file_path = os.path.join(input_dir, filename)
+        thumbnail_path = os.path.join(output_dir, filename)
+        futures[executor.submit(create_thumbnail, file_path, thumbnail_path, record['width'], record['height'], max_width, max_height)] = filename
+
+    for future in concurrent.futures.as_completed(futures):
+        filename = futures[future]
+        manifest[filename]['thumbnail'] = future.result()
+        if manifest[filename]['thumbnail']:
+            print("Step 1: generated thumbnail for image "+str(count)+" of "+str(len(pending))+" "+filename  )
+        else:
+            print(f'!!! Error: No thumbnail for image {count} of {len(pending)} {filename} !!!')
+        count=count+1
+
+def write_kml_header(kml, item):
+    """Write the KML header with the document name and the image style."""
+    kml.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    kml.write('<kml\n')
+    kml.write('xmlns="http://www.opengis.net/kml/2.2"\n')
+    kml.write('xmlns:gx="http://www.google.com/kml/ext/2.2"\n')
+    kml.write('xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n')
+    kml.write('xsi:schemaLocation="http://www.opengis.net/kml/2.2 https://developers.google.com/kml/schema/kml22gx.xsd">\n')
+    kml.write(f"<Document><name>{item['name']}-{item['product_type']}</name>\n")
+    kml.write('<Style id="image_style">\n')
+    kml.write('<IconStyle>\n')
+    kml.write(f"<scale>{item['icon_scale']}</scale>\n")
+    kml.write(f"<Icon><href>{item['icon_url']}</href><gx:w>48</gx:w><gx:h>48</gx:h></Icon>\n")  # Halbe Größe
+    kml.write('</IconStyle>\n')
+    kml.write('<LabelStyle>\n')
+    kml.write('<color>ff0000ff</color><scale>1.5</scale>\n')  # Halbe Skalierung
+    kml.write('</LabelStyle>\n')
+    kml.write('</Style>\n')
+
+def write_kml_footer(kml):
+    """Close the document of a KML."""
+    kml.write('</Document>\n')
+    kml.write('</kml>\n')
+
+def write_placemark(kml, filename, record, item):
+    """Write the placemark of an image with the link to the full resolution and the thumbnail."""
+    lat, lon, timestamp = record['lat'], record['lon'], record['timestamp']
+    base_url = item['base_url']
+    kml.write('<Placemark>\n')
+    kml.write('<name></name>\n')
+    kml.write(f'<description><![CDATA[<a href="{base_url}{filename}">Download-View Fullresolution</a> {timestamp}<br>')
+    kml.write(f'<img style="max-width:400px;" src="{base_url}thumbs/{filename}">]]></description>\n')
+    kml.write(f'<styleUrl>#image_style</styleUrl>\n')
+    kml.write('<Point>\n')
+    kml.write(f'<coordinates>{lon},{lat},0</coordinates>\n')
+    kml.write('</Point>\n')
+    kml.write('</Placemark>\n')
+
+def get_georeferenced(manifest):
+    """Images with GPS position, an error is printed for the others."""
+    image_count = len(manifest)
+    images = []
+    for count, (filename, record) in enumerate(manifest.items(), 1):
+        if record['gps']:
+            images.append((filename, record))
+        else: # In case no gps tags are available
+            print(f'!!! Error: No GPS tag for image {count} of {image_count} {filename} !!!')
+    return images
+
+def generate_kml(manifest, kml_file, item):
 
     with open(kml_file, 'w') as kml:
-        
-        
-        kml.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        kml.write('<kml\n')
-        kml.write('xmlns="http://www.opengis.net/kml/2.2"\n')
-        kml.write('xmlns:gx="http://www.google.com/kml/ext/2.2"\n')
-        kml.write('xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n')
-        kml.write('xsi:schemaLocation="http://www.opengis.net/kml/2.2 https://developers.google.com/kml/schema/kml22gx.xsd">\n')
-        kml.write(f'<Document><name>{ITEM_NAME}-{PRODUCT_TYPE}</name>\n')
-        kml.write('<Style id="image_style">\n')
-        kml.write('<IconStyle>\n')
-        kml.write(f'<scale>{ICON_SCALE}</scale>\n')
-        kml.write(f'<Icon><href>{ICON_URL}</href><gx:w>48</gx:w><gx:h>48</gx:h></Icon>\n')  # Halbe Größe
-        kml.write('</IconStyle>\n')
-        kml.write('<LabelStyle>\n')
-        kml.write('<color>ff0000ff</color><scale>1.5</scale>\n')  # Halbe Skalierung
-        kml.write('</LabelStyle>\n')
-        kml.write('</Style>\n')
-        
+        write_kml_header(kml, item)
+
+        image_count = len(manifest)
         count=1
-        for filename in os.listdir(input_dir):
-            file_path = os.path.join(input_dir, filename)
-            
-            if os.path.isfile(file_path) and filename.lower().endswith(('.jpg', '.jpeg')):
-                print("Step 2: generating kmlinfo for image "+str(count)+" of "+str(image_count)+" "+filename  )
-                lat, lon, timestamp = extract_exif(file_path)
-                
-                if lat is not None and lon is not None:
-                    kml.write('<Placemark>\n')
-                    kml.write('<name></name>\n')
-                    kml.write(f'<description><![CDATA[<a href="{BASE_URL}{filename}">Download-View Fullresolution</a> {timestamp}<br>')
-                    kml.write(f'<img style="max-width:400px;" src="{BASE_URL}thumbs/{filename}">]]></description>\n')
-                    kml.write(f'<styleUrl>#image_style</styleUrl>\n')
-                    kml.write('<Point>\n')
-                    kml.write(f'<coordinates>{lon},{lat},0</coordinates>\n')
-                    kml.write('</Point>\n')
-                    kml.write('</Placemark>\n')
-                else: # In case no gps tags are available
-                    print(f'!!! Error: No GPS tag for image {count} of {image_count} {filename} !!!')
-                count=count+1  
-
-        kml.write('</Document>\n')
-        kml.write('</kml>\n')
-
-def generate_txt(input_dir, txt_file):
+        for filename, record in manifest.items():
+            print("Step 2: generating kmlinfo for image "+str(count)+" of "+str(image_count)+" "+filename  )
+            if record['gps']:
+                write_placemark(kml, filename, record, item)
+            else: # In case no gps tags are available
+                print(f'!!! Error: No GPS tag for image {count} of {image_count} {filename} !!!')
+            count=count+1  
+
+        write_kml_footer(kml)
+
+def build_quadtree(images, bounds, tile_id="0", depth=0):
+    """
+    Split the images into tiles of a quadtree, each tile holds at most KML_TILE_SIZE placemarks.
+    A tile keeps an evenly spread sample of its images, the others are passed to the four child tiles,
+    so that zoomed out views show a sample and more images appear when zooming in.
+    Returns a list of (tile_id, bounds, images, child tile ids), the root tile first.
+    """
+    if len(images) <= KML_TILE_SIZE or depth >= KML_MAX_DEPTH:
+        return [(tile_id, bounds, images, [])]
+
+    step = len(images) / KML_TILE_SIZE
+    sample = {int(i * step) for i in range(KML_TILE_SIZE)}
+    own_images = [image for i, image in enumerate(images) if i in sample]
+    west, south, east, north = bounds
+    center_lon, center_lat = (west + east) / 2, (south + north) / 2
+    quadrants = [(west, center_lat, center_lon, north), (center_lon, center_lat, east, north),
+                 (west, south, center_lon, center_lat), (center_lon, south, east, center_lat)]
+    quadrant_images = [[], [], [], []]
+    for i, image in enumerate(images):
+        if i not in sample:
+            record = image[1]
+            quadrant_images[(record['lat'] < center_lat) * 2 + (record['lon'] >= center_lon)].append(image)
+
+    tiles = [None]
+    children = []
+    for quadrant, (quadrant_bounds, child_images) in enumerate(zip(quadrants, quadrant_images)):
+        if child_images:
+            child_id = tile_id + str(quadrant)
+            children.append(child_id)
+            tiles += build_quadtree(child_images, quadrant_bounds, child_id, depth + 1)
+    tiles[0] = (tile_id, bounds, own_images, children)
+    return tiles
+
+def write_network_link(kml, tile_id, bounds, href):
+    """Write the link to a tile, the tile is only loaded when its region is in view."""
+    west, south, east, north = bounds
+    kml.write(f'<NetworkLink><name>{tile_id}</name>\n')
+    kml.write('<Region><LatLonAltBox>')
+    kml.write(f'<north>{north}</north><south>{south}</south><east>{east}</east><west>{west}</west>')
+    kml.write(f'</LatLonAltBox><Lod><minLodPixels>{KML_MIN_LOD_PIXELS}</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod></Region>\n')
+    kml.write(f'<Link><href>{href}</href><viewRefreshMode>onRegion</viewRefreshMode></Link>\n')
+    kml.write('</NetworkLink>\n')
+
+def generate_regionated_kml(manifest, kml_file, item, kmz=False):
+    """
+    Write the placemarks into KML tiles of a quadtree linked with NetworkLink and Region/Lod,
+    viewers only load the tiles in view. The tiles are written into a folder next to the KML
+    (<name>_tiles), or with kmz=True together with the root KML into one KMZ file.
+    """
+    images = get_georeferenced(manifest)
+    if images:
+        lons = [record['lon'] for filename, record in images]
+        lats = [record['lat'] for filename, record in images]
+        bounds = [min(lons), min(lats), max(lons), max(lats)]
+    else:
+        bounds = [0, 0, 0, 0]
+    # Avoid an empty region if all images have the same position
+    bounds = [bounds[0] - 0.001, bounds[1] - 0.001, bounds[2] + 0.001, bounds[3] + 0.001]
+    tiles = build_quadtree(images, bounds)
+    print(f"Step 2: {len(images)} images in {len(tiles)} KML tiles")
+
+    tile_dir = os.path.splitext(os.path.basename(kml_file))[0] + "_tiles"
+    tile_bounds_by_id = {tile[0]: tile[1] for tile in tiles}
+    documents = {}
+    for tile_id, tile_bounds, tile_images, children in tiles:
+        kml = io.StringIO()
+        write_kml_header(kml, item)
+        for filename, record in tile_images:
+            write_placemark(kml, filename, record, item)
+        for child_id in children:
+            # The root KML links into the tiles folder, the tiles link to their neighbours in the folder
+            href = f"{tile_dir}/{child_id}.kml" if tile_id == "0" else f"{child_id}.kml"
+            write_network_link(kml, child_id, tile_bounds_by_id[child_id], href)
+        write_kml_footer(kml)
+        documents["doc.kml" if tile_id == "0" else f"{tile_dir}/{tile_id}.kml"] = kml.getvalue()
+
+    if kmz:
+        with zipfile.ZipFile(kml_file + '.tmp', 'w', zipfile.ZIP_DEFLATED) as archive:
+            # doc.kml first, it is the document opened by the viewers
+            for name, document in documents.items():
+                archive.writestr(name, document)
+        os.replace(kml_file + '.tmp', kml_file)
+    else:
+        tile_path = os.path.join(os.path.dirname(kml_file), tile_dir)
+        # Remove the tiles of an earlier run
+        shutil.rmtree(tile_path, ignore_errors=True)
+        os.makedirs(tile_path)
+        for name, document in documents.items():
+            with open(kml_file if name == "doc.kml" else os.path.join(os.path.dirname(kml_file), name), 'w') as kml:
+                kml.write(document)
+
+def hilbert_index(x, y, order=HILBERT_ORDER):
+    """Position of the cell x, y (0 .. 2^order-1) along a Hilbert curve."""
+    index = 0
+    size = 1 << (order - 1)
+    while size > 0:
+        rx = 1 if x & size else 0
+        ry = 1 if y & size else 0
+        index += size * size * ((3 * rx) ^ ry)
+        # Rotate the quadrant
+        if ry == 0:
+            if rx == 1:
+                x = size - 1 - x
+                y = size - 1 - y
+            x, y = y, x
+        x &= size - 1
+        y &= size - 1
+        size >>= 1
+    return index
+
+def generate_catalog(manifest, catalog_file, item):
+    """
+    Write the georeferenced images as GeoJSON sequence (one feature per line) with position, time,
+    full resolution and thumbnail URL. The features are sorted along a Hilbert curve, so the
+    records are spatially clustered: images close to each other are mostly close in the file.
+    """
+    # The images without GPS position are already reported by the KML step
+    images = [(filename, record) for filename, record in manifest.items() if record['gps']]
+    if images:
+        west = min(record['lon'] for filename, record in images)
+        south = min(record['lat'] for filename, record in images)
+        width = max(record['lon'] for filename, record in images) - west or 1
+        height = max(record['lat'] for filename, record in images) - south or 1
+        cells = (1 << HILBERT_ORDER) - 1
+        images.sort(key=lambda image: hilbert_index(int((image[1]['lon'] - west) / width * cells),
+                                                    int((image[1]['lat'] - south) / height * cells)))
+
+    with open(catalog_file + '.tmp', 'w', encoding='utf-8') as catalog:
+        for filename, record in images:
+            timestamp = record['timestamp']
+            # EXIF time YYYY:MM:DD HH:MM:SS to ISO 8601
+            if timestamp and re.fullmatch(r'\d{4}:\d{2}:\d{2} \d{2}:\d{2}:\d{2}', timestamp):
+                timestamp = timestamp[:10].replace(':', '-') + 'T' + timestamp[11:]
+            feature = {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [record['lon'], record['lat']]},
+                'properties': {
+                    'filename': filename,
+                    'timestamp': timestamp,
+                    'url': item['base_url'] + filename,
+                    'thumbnail_url': item['base_url'] + 'thumbs/' + filename,
+                },
+            }
+            catalog.write(json.dumps(feature, separators=(',', ':')) + '\n')
+    os.replace(catalog_file + '.tmp', catalog_file)
+    print(f"Step 3: {len(images)} images in catalog {catalog_file}")
+
+def generate_txt(manifest, txt_file, item):
 
     with open(txt_file, 'w') as txt:
                
-        count=1
-        for filename in os.listdir(input_dir):
-            file_path = os.path.join(input_dir, filename)
-            
-            if os.path.isfile(file_path) and filename.lower().endswith(('.jpg', '.jpeg')):
-              
-                txt.write(f'{BASE_URL}{filename}\n')
-                
-                count=count+1    
+        for filename in manifest:
+            txt.write(f"{item['base_url']}{filename}\n")
+
+
+class UploadError(Exception):
+    """Upload request rejected by the target, status is the HTTP status (None for local targets)."""
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+def compute_etag(file_path):
+    """
+    Checksum of a file as S3 reports it in the ETag: MD5 of the file, or for files uploaded
+    in parts the MD5 of the MD5 of all parts followed by the number of parts.
+    """
+    with open(file_path, 'rb') as f:
+        if os.path.getsize(file_path) <= UPLOAD_MULTIPART_THRESHOLD:
+            md5 = hashlib.md5()
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(block)
+            return md5.hexdigest()
+        part_digests = [hashlib.md5(part).digest() for part in iter(lambda: f.read(UPLOAD_PART_SIZE), b'')]
+    return hashlib.md5(b''.join(part_digests)).hexdigest() + f"-{len(part_digests)}"
+
+class FileTarget:
+    """Upload target on the file system, e.g. a network share or a local test directory."""
+    def __init__(self, root):
+        self.root = root
+
+    def get_etag(self, key, size):
+        """Checksum of the stored object, None if it does not exist or has another size."""
+        path = os.path.join(self.root, *key.split('/'))
+        try:
+            if os.path.getsize(path) != size:
+                return None
+        except OSError:
+            return None
+        return compute_etag(path)
+
+    def put(self, key, file_path, etag):
+        """Copy a file, it only replaces the stored object once it is complete and verified."""
+        path = os.path.join(self.root, *key.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        retry(shutil.copyfile, file_path, path + '.tmp')
+        if compute_etag(path + '.tmp') != etag:
+            os.remove(path + '.tmp')
+            raise UploadError(f"Checksum of the copy of {file_path} does not match")
+        os.replace(path + '.tmp', path)
+
+class S3Target:
+    """
+    Upload target in an S3 compatible object storage, given as s3://bucket/prefix.
+    Endpoint and credentials are read from AWS_ENDPOINT_URL, AWS_REGION, AWS_ACCESS_KEY_ID and
+    AWS_SECRET_ACCESS_KEY. Every thread keeps its own connection open for all of its requests.
+    """
+    def __init__(self, url):
+        bucket_prefix = url[len("s3://"):].strip('/')
+        self.bucket, _, self.prefix = bucket_prefix.partition('/')
+        self.region = os.environ.get('AWS_REGION', 'us-east-1')
+        endpoint = urllib.parse.urlsplit(os.environ.get('AWS_ENDPOINT_URL', f"https://s3.{self.region}.amazonaws.com"))
+        self.scheme, self.host = endpoint.scheme, endpoint.netloc
+        self.access_key = os.environ.get('AWS_ACCESS_KEY_ID', '')
+        self.secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY', '')
+        self.local = threading.local()
+
+    def object_path(self, key):
+        """Path style URL path of an object."""
+        key = f"{self.prefix}/{key}" if self.prefix else key
+        return urllib.parse.quote(f"/{self.bucket}/{key}", safe='/-_.~')
+
+    def request(self, method, key, query=None, headers=None, body=b''):
+        """Send a signed request, returns status, response headers and body."""
+        query = query or {}
+        path = self.object_path(key)
+        headers = sign_request(method, self.host, path, query, headers or {}, self.access_key, self.secret_key, self.region)
+        if query:
+            path += '?' + '&'.join(f"{quote_aws(name)}={quote_aws(value)}" if value else quote_aws(name)
+                                   for name, value in sorted(query.items()))
+
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            connection = self.local.connection = connection_class(self.host, timeout=60)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Open a new connection for the next attempt
+            connection.close()
+            self.local.connection = None
+            raise
+        # Without list permission on the bucket S3 answers 403 instead of 404 for a missing object
+        if response.status >= 300 and not (method == 'HEAD' and response.status in (403, 404)):
+            raise UploadError(f"{method} {path}: HTTP {response.status} {data[:200]!r}", response.status)
+        return response.status, response.headers, data
+
+    def get_etag(self, key, size):
+        """Checksum of the stored object, None if it does not exist, cannot be checked or has another size."""
+        status, headers, data = self.request('HEAD', key)
+        if status in (403, 404) or int(headers.get('Content-Length', -1)) != size:
+            return None
+        return headers.get('ETag', '').strip('"')
+
+    def put(self, key, file_path, etag):
+        """Upload a file, files larger than UPLOAD_MULTIPART_THRESHOLD in parts of UPLOAD_PART_SIZE."""
+        size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            if size <= UPLOAD_MULTIPART_THRESHOLD:
+                body = f.read()
+                status, headers, data = retry(self.request, 'PUT', key, None, {'Content-MD5': content_md5(body)}, body)
+            else:
+                status, headers, data = retry(self.request, 'POST', key, {'uploads': ''})
+                upload_id = xml_text(data, 'UploadId')
+                parts = []
+                try:
+                    part_number = 1
+                    while True:
+                        body = f.read(UPLOAD_PART_SIZE)
+                        if not body:
+                            break
+                        query = {'partNumber': str(part_number), 'uploadId': upload_id}
+                        status, headers, data = retry(self.request, 'PUT', key, query, {'Content-MD5': content_md5(body)}, body)
+                        parts.append(f"<Part><PartNumber>{part_number}</PartNumber><ETag>{headers.get('ETag')}</ETag></Part>")
+                        part_number += 1
+                    body = ("<CompleteMultipartUpload>" + "".join(parts) + "</CompleteMultipartUpload>").encode()
+                    status, headers, data = retry(self.request, 'POST', key, {'uploadId': upload_id}, {}, body)
+                except (OSError, http.client.HTTPException, UploadError):
+                    # Do not leave the uploaded parts in the bucket
+                    try:
+                        self.request('DELETE', key, {'uploadId': upload_id})
+                    except (OSError, http.client.HTTPException, UploadError):
+                        pass
+                    raise
+                headers = {'ETag': xml_text(data, 'ETag')}
+        if headers.get('ETag', '').strip('"') != etag:
+            raise UploadError(f"Checksum of the upload of {file_path} does not match")
+
+def quote_aws(value):
+    """URL encoding as required by the AWS signature."""
+    return urllib.parse.quote(value, safe='-_.~')
+
+def content_md5(body):
+    """Content-MD5 header, the target rejects the request if the data was changed in transit."""
+    return base64.b64encode(hashlib.md5(body).digest()).decode()
+
+def xml_text(data, tag):
+    """Text of the first element with the given tag in an S3 response."""
+    for element in ElementTree.fromstring(data).iter():
+        if element.tag.rsplit('}', 1)[-1] == tag:
+            return element.text
+    raise UploadError(f"No {tag} in response {data[:200]!r}")
+
+def sign_request(method, host, path, query, headers, access_key, secret_key, region, now=None):
+    """Add the AWS Signature Version 4 headers to the headers of a request."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    headers = {name.lower(): value for name, value in headers.items()}
+    headers.setdefault('x-amz-content-sha256', 'UNSIGNED-PAYLOAD')
+    headers.update({'host': host, 'x-amz-date': amz_date})
+
+    signed_headers = ';'.join(sorted(headers))
+    canonical_request = '\n'.join([
+        method, path,
+        '&'.join(f"{quote_aws(name)}={quote_aws(value)}" for name, value in sorted(query.items())),
+        ''.join(f"{name}:{str(headers[name]).strip()}\n" for name in sorted(headers)),
+        signed_headers, headers['x-amz-content-sha256']])
+    scope = f"{amz_date[:8]}/{region}/s3/aws4_request"
+    string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()])
+
+    key = ('AWS4' + secret_key).encode()
+    for part in (amz_date[:8], region, 's3', 'aws4_request'):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers['Authorization'] = f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}"
+    return headers
+
+def is_retryable(error):
+    """True for errors that can go away with another attempt: network errors, server errors and throttling."""
+    if isinstance(error, UploadError):
+        # Client errors (wrong credentials, missing bucket) and wrong responses stay the same
+        return error.status is not None and (error.status >= 500 or error.status == 429)
+    # Local errors (missing file, no permission) stay the same as well
+    return isinstance(error, (http.client.HTTPException, ConnectionError, TimeoutError, socket.timeout, socket.gaierror))
+
+def retry(function, *args):
+    """Call a function again after network errors or server errors, waiting longer after each attempt."""
+    for attempt in range(UPLOAD_RETRIES):
+        try:
+            return function(*args)
+        except (OSError, http.client.HTTPException, UploadError) as e:
+            if not is_retryable(e) or attempt == UPLOAD_RETRIES - 1:
+                raise
+            delay = UPLOAD_BACKOFF * 2 ** attempt * (1 + random.random())
+            print(f"Upload error ({e}), retrying in {delay:.1f} s")
+            time.sleep(delay)
+
+def open_target(target):
+    """Upload target for s3://bucket/prefix or a directory."""
+    if target.startswith("s3://"):
+        return S3Target(target)
+    return FileTarget(target)
 
+def upload_file(target, key, file_path):
+    """Upload a file unless the target already has it with the same checksum, returns True if it was uploaded."""
+    etag = compute_etag(file_path)
+    if retry(target.get_etag, key, os.path.getsize(file_path)) == etag:
+        return False
+    target.put(key, file_path, etag)
+    return True
+
+def upload_item(target, files):
+    """
+    Upload the files of an item, list of (key, file path), with UPLOAD_WORKERS files at the same time.
+    Returns the keys of the files that could not be uploaded.
+    """
+    failed = []
+    skipped = 0
+    count=1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = {executor.submit(upload_file, target, key, file_path): key for key, file_path in files}
+        for future in concurrent.futures.as_completed(futures):
+            key = futures[future]
+            try:
+                if future.result():
+                    print("Step 4: uploaded file "+str(count)+" of "+str(len(files))+" "+key)
+                else:
+                    skipped += 1
+            except (OSError, http.client.HTTPException, UploadError) as e:
+                print(f'!!! Error: Upload of {key} failed: {e} !!!')
+                failed.append(key)
+            count=count+1
+    print(f"Step 4: {len(files) - skipped - len(failed)} files uploaded, {skipped} already up to date, {len(failed)} failed")
+    return failed
+
+
+def publish_item(input_directory, export_directory, item, kml_mode, upload_target, executor):
+    """
+    Run all steps for one item: inventory, thumbnails, KML, catalog, TXT and upload.
+    Metadata and thumbnails are processed in the threads of the executor.
+    Returns the paths of KML, TXT and catalog and the files that could not be uploaded.
+    """
+    #Defeine variables based on input
+    output_directory = os.path.join(input_directory, 'thumbs')
+    basename = item['name']+"-"+item['product_type']
+    kml_filepath = os.path.join(export_directory, basename+('.kmz' if kml_mode == "kmz" else '.kml'))
+    txt_filepath = os.path.join(export_directory, basename+'.txt')
+    catalog_filepath = os.path.join(export_directory, basename+'.geojsonl')
+
+    # Only new or changed images are read again
+    manifest = update_manifest(input_directory, load_manifest(input_directory), executor)
+    save_manifest(input_directory, manifest)
+
+    resize_images(input_directory, output_directory, max_width, max_height, manifest, executor)
+    save_manifest(input_directory, manifest)
+   
+    if kml_mode == "single":
+        generate_kml(manifest, kml_filepath, item)
+    else:
+        generate_regionated_kml(manifest, kml_filepath, item, kmz=kml_mode == "kmz")
+
+    generate_catalog(manifest, catalog_filepath, item)
+
+    generate_txt(manifest, txt_filepath, item)
+
+    # Upload originals, thumbnails, TXT and catalog to COLLECTION/ITEM_NAME
+    failed_uploads = []
+    if upload_target:
+        files = [(f"{item['name']}/{filename}", os.path.join(input_directory, filename)) for filename in manifest]
+        files += [(f"{item['name']}/thumbs/{filename}", os.path.join(output_directory, filename))
+                  for filename, record in manifest.items() if record['thumbnail']]
+        files += [(f"{item['name']}/{os.path.basename(path)}", path) for path in (txt_filepath, catalog_filepath)]
+        failed_uploads = upload_item(open_target(upload_target), files)
+
+    return kml_filepath, txt_filepath, catalog_filepath, failed_uploads
 
+def load_jobs(jobs_file):
+    """
+    Read and check the jobs of the batch mode: a JSON list of objects with input, item and product
+    (SENKRECHT or SCHRAEG) and optionally export (default: input directory), kml (single, regionated
+    or kmz, default single) and upload (directory or s3://bucket/prefix).
+    """
+    with open(jobs_file, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError("the batch file must contain a list of jobs")
 
+    errors = []
+    inputs = set()
+    for number, job in enumerate(jobs, 1):
+        job.setdefault('export', job.get('input'))
+        job.setdefault('kml', "single")
+        job.setdefault('upload', "")
+        if not check_directory_exists(job.get('input') or ""):
+            errors.append(f"job {number}: input directory '{job.get('input')}' does not exist")
+        # Two jobs on the same input directory would overwrite each other's manifest and thumbnails
+        if job.get('input') in inputs:
+            errors.append(f"job {number}: input directory '{job.get('input')}' is used by another job")
+        inputs.add(job.get('input'))
+        if not check_directory_exists(job['export'] or ""):
+            errors.append(f"job {number}: export directory '{job['export']}' does not exist")
+        if not check_item_name(job.get('item') or ""):
+            errors.append(f"job {number}: item NAME '{job.get('item')}' is invalid, format YYYY-###-CAPITALLETTERS")
+        if job.get('product') not in PRODUCTS:
+            errors.append(f"job {number}: product '{job.get('product')}' is invalid, use {' or '.join(PRODUCTS)}")
+        if job['kml'] not in KML_MODES:
+            errors.append(f"job {number}: kml '{job['kml']}' is invalid, use {', '.join(KML_MODES)}")
+    if errors:
+        raise ValueError("\n".join(errors))
+    return jobs
+
+def run_batch(jobs):
+    """
+    Publish all items of the batch at the same time. The items share one pool of threads
+    (one per core) for the metadata and the thumbnails. Returns the number of failed items.
+    """
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=thumbnail_workers) as executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=len(jobs) or 1) as job_executor:
+        futures = {job_executor.submit(publish_item, job['input'], job['export'], make_item(job['item'], job['product']),
+                                       job['kml'], job['upload'], executor): job for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            try:
+                kml_filepath, txt_filepath, catalog_filepath, failed_uploads = future.result()
+            except Exception as e:
+                print(f"!!! Error: item {job['item']} failed: {e} !!!")
+                failed += 1
+                continue
+            print(f"Item {job['item']}: KML {kml_filepath}, TXT {txt_filepath}, Katalog {catalog_filepath}")
+            if failed_uploads:
+                print(f"!!! Error: item {job['item']}: {len(failed_uploads)} files not uploaded !!!")
+                failed += 1
+    return failed
 
 if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Publish Einzelbilder: thumbnails, KML, TXT, catalog and upload.")
+    parser.add_argument('--batch', metavar='JOBS.json',
+                        help="Publish the items listed in a JSON file at the same time without prompts")
+    args = parser.parse_args()
+
+    if args.batch:
+        try:
+            jobs = load_jobs(args.batch)
+        except (OSError, ValueError) as e:
+            print(f"!!! Error: invalid batch file {args.batch}:\n{e}")
+            exit(1)
+        exit(1 if run_batch(jobs) else 0)
     
     # Initialize input_directory
     input_directory = ""
@@ -241,7 +999,14 @@ if __name__ == "__main__":
 
 
      # Prompt the user The Product type
-    option, ICON_URL, ICON_SCALE, PRODUCT_TYPE = prompt_choice()
+    product = prompt_choice()
+    option = PRODUCTS[product][0]
+
+    # Prompt the user for the KML type
+    kml_mode = prompt_kml_mode()
+
+    # Prompt the user for the upload target
+    upload_target = prompt_upload_target()
 
     # Prompt the user for the item NAME
     # Initialize item_name
@@ -260,41 +1025,37 @@ if __name__ == "__main__":
         else:
             print(f"The item NAME '{ITEM_NAME}' is invalid. Please enter a valid item NAME in the format YYYY-###-CAPITALLETTERS. e.g. 2024-001-WALLIS")
 
-        BASE_URL = COLLECTION+ITEM_NAME+"/"
-
     # Print the collected information
     print("\n")
     print("************************************\n")
     print(f"INPUT Directory: {input_directory}")
     print(f"EXPORT Directory: {export_directory}")
     print(f"Selected OPTION: {option}")
+    print(f"KML type: {kml_mode}")
+    print(f"UPLOAD target: {upload_target or '-'}")
     print(f"ITEM Name: {ITEM_NAME}\n")
     print("************************************\n")
     print("\n")
 
-    #Defeine variables based on input
-    output_directory = os.path.join(input_directory, 'thumbs')
-    kml_filepath = os.path.join(export_directory, ITEM_NAME+"-"+PRODUCT_TYPE+'.kml')
-    txt_filepath = os.path.join(export_directory, ITEM_NAME+"-"+PRODUCT_TYPE+'.txt')
-
-    #count the fiels to estimate a job run time
-    image_count = sum(1 for f in os.listdir(input_directory) if f.lower().endswith(('.jpg', '.jpeg')))
-
     #RUN the different steps
+    with concurrent.futures.ThreadPoolExecutor(max_workers=thumbnail_workers) as executor:
+        kml_filepath, txt_filepath, catalog_filepath, failed_uploads = publish_item(
+            input_directory, export_directory, make_item(ITEM_NAME, product), kml_mode, upload_target, executor)
 
-    resize_images(input_directory, output_directory, max_width, max_height,image_count)
-   
-    generate_kml(input_directory,  kml_filepath,image_count)
-
-    generate_txt(input_directory, txt_filepath)
-
-    
     print(f"KML-Datei erstellt: {kml_filepath}")
     print(f"TXT-Datei erstellt: {txt_filepath}")
+    print(f"Katalog erstellt: {catalog_filepath}")
     print("Nächste Schritte:")
     print("    - meta.txt erstellen und nach bgdiscratch ")
-    print("    - KML in hostpoint ablegen")
-    print(f"    - thumbs und originaldaten aus dem {input_directory} und {txt_filepath} nach bgdiscratch kopieren")
+    if kml_mode == "regionated":
+        print(f"    - KML und Ordner {os.path.splitext(os.path.basename(kml_filepath))[0]}_tiles in hostpoint ablegen")
+    else:
+        print("    - KML in hostpoint ablegen")
+    if not upload_target:
+        print(f"    - {catalog_filepath} nach bgdiscratch kopieren")
+        print(f"    - thumbs und originaldaten aus dem {input_directory} und {txt_filepath} nach bgdiscratch kopieren (ohne {MANIFEST_FILE})")
+    elif failed_uploads:
+        print(f"    - {len(failed_uploads)} nicht hochgeladene Dateien: Skript nochmals starten, nur diese werden hochgeladen")
     print("    - beten")
 
     # Add a prompt to ask the user if they want to quit
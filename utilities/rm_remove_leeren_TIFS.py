@@ -1,67 +1,356 @@
 import os
+import argparse
+import concurrent.futures
+import json
+import struct
+import zlib
+import hashlib
+import math
 
-#Ask/Set user parameter
-folder=input("\nGive folder Path:")
+# TIFF tags used to find and decode the blocks (tiles or strips) of the image
+TAG_IMAGE_WIDTH = 256
+TAG_IMAGE_LENGTH = 257
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_STRIP_OFFSETS = 273
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_ROWS_PER_STRIP = 278
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_PLANAR_CONFIGURATION = 284
+TAG_PREDICTOR = 317
+TAG_TILE_WIDTH = 322
+TAG_TILE_LENGTH = 323
+TAG_TILE_OFFSETS = 324
+TAG_TILE_BYTE_COUNTS = 325
+TAG_SAMPLE_FORMAT = 339
+TAG_GDAL_NODATA = 42113
+# TIFF field types: type -> (struct format, size)
+TIFF_TYPES = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('I', 4), 6: ('b', 1), 7: ('B', 1), 8: ('h', 2), 9: ('i', 4),
+              11: ('f', 4), 12: ('d', 8), 16: ('Q', 8), 17: ('q', 8), 18: ('Q', 8)}
+# struct format of a sample: (SampleFormat, BitsPerSample) -> format
+SAMPLE_FORMATS = {(1, 8): 'B', (1, 16): 'H', (1, 32): 'I', (2, 8): 'b', (2, 16): 'h', (2, 32): 'i', (3, 32): 'f', (3, 64): 'd'}
+# A TIF with more different blocks than this contains data, the blocks are not decoded
+MAX_DECODED_BLOCKS = 16
+# Blocks decoded first (first, last and evenly spaced in between), a TIF with data mostly has data in one of them
+SAMPLE_BLOCKS = 8
+# Files deleted together with an empty TIF: world file, GDAL metadata and overviews
+# (x.tfw, x.aux.xml, x.ovr, x.tif.aux.xml, x.tif.ovr)
+SIDECAR_EXTENSIONS = ('.tfw', '.aux.xml', '.ovr')
+# Directories listed and TIFs checked at the same time, most of the time is spent waiting for the network share
+default_workers = 8
 
+def read_tiff_tags(file_path):
+    """Read the tags of the first IFD (full resolution image) of a TIFF or BigTIFF, tag -> value(s)."""
+    with open(file_path, 'rb') as f:
+        header = f.read(16)
+        byte_order = {b'II': '<', b'MM': '>'}.get(header[:2])
+        if byte_order is None:
+            raise ValueError("Not a TIFF file")
+        version = struct.unpack_from(byte_order + 'H', header, 2)[0]
+        if version == 42:
+            ifd_offset = struct.unpack_from(byte_order + 'I', header, 4)[0]
+            count_format, entry_format, offset_format = 'H', 'HHI4s', 'I'
+        elif version == 43:
+            ifd_offset = struct.unpack_from(byte_order + 'Q', header, 8)[0]
+            count_format, entry_format, offset_format = 'Q', 'HHQ8s', 'Q'
+        else:
+            raise ValueError("Not a TIFF file")
 
-# Set the size threshold in bytes (e.g., 1 MB = 1,000,000 bytes)
-size_threshold = 557480  # Change this value to your desired threshold
-Sumup = "Leeren TIFs:\n"
-counter=0
+        f.seek(ifd_offset)
+        count_size = struct.calcsize(count_format)
+        count = struct.unpack(byte_order + count_format, f.read(count_size))[0]
+        entry_size = struct.calcsize(byte_order + entry_format)
+        entries = f.read(count * entry_size)
+        tags = {}
+        for i in range(count):
+            tag, field_type, value_count, value = struct.unpack_from(byte_order + entry_format, entries, i * entry_size)
+            if field_type not in TIFF_TYPES:
+                continue
+            fmt, size = TIFF_TYPES[field_type]
+            # Values larger than the entry are stored at an offset
+            if size * value_count > len(value):
+                f.seek(struct.unpack(byte_order + offset_format, value)[0])
+                value = f.read(size * value_count)
+            if field_type == 2:
+                tags[tag] = value[:value_count].split(b'\0')[0].decode('ascii', 'replace')
+            else:
+                tags[tag] = list(struct.unpack(byte_order + fmt * value_count, value[:size * value_count]))
+    return tags, byte_order
 
-def execute_code(Sumup,counter):
-    # List to store names of files to be deleted
-    files_to_delete = []
-    
-    # Example processing code: Search for .tif files, check their sizes, and delete if below threshold
+def get_nodata(tags):
+    """Nodata value of the TIF (GDAL_NODATA tag), 0 if it is not set."""
+    try:
+        return float(tags.get(TAG_GDAL_NODATA, 0))
+    except ValueError:
+        return 0.0
+
+def decode_block(data, tags):
+    """Decompress a block with the standard library, None if the compression is not supported."""
+    compression = tags.get(TAG_COMPRESSION, [1])[0]
+    if tags.get(TAG_PREDICTOR, [1])[0] != 1:
+        return None
+    if compression == 1:
+        return data
+    if compression in (8, 32946):
+        return zlib.decompress(data)
+    if compression == 32773:
+        # PackBits
+        decoded = bytearray()
+        i = 0
+        while i < len(data):
+            n = data[i]
+            if n < 128:
+                decoded += data[i + 1:i + 2 + n]
+                i += 2 + n
+            elif n > 128:
+                decoded += data[i + 1:i + 2] * (257 - n)
+                i += 2
+            else:
+                i += 1
+        return bytes(decoded)
+    return None
+
+def block_is_nodata(data, tags, byte_order):
+    """Check if all samples of a decoded block are nodata."""
+    sample_format = SAMPLE_FORMATS.get((tags.get(TAG_SAMPLE_FORMAT, [1])[0], tags.get(TAG_BITS_PER_SAMPLE, [8])[0]))
+    if sample_format is None:
+        return False
+    nodata = get_nodata(tags)
+    pattern = struct.pack(byte_order + sample_format, nodata if sample_format in 'fd' else int(nodata))
+    return len(data) % len(pattern) == 0 and data == pattern * (len(data) // len(pattern))
+
+def gdal_blocks_are_nodata(file_path, block_indices, tags):
+    """
+    Decode blocks with GDAL (e.g. JPEG or LZW compressed) and check if they are nodata.
+    Returns None if the GDAL Python bindings are not available.
+    """
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return None
+
+    dataset = gdal.Open(file_path)
+    if dataset is None:
+        return None
+    width, height = tags[TAG_IMAGE_WIDTH][0], tags[TAG_IMAGE_LENGTH][0]
+    block_width = tags.get(TAG_TILE_WIDTH, [width])[0]
+    block_height = tags.get(TAG_TILE_LENGTH, tags.get(TAG_ROWS_PER_STRIP, [height]))[0]
+    blocks_across = math.ceil(width / block_width)
+    blocks_per_band = blocks_across * math.ceil(height / block_height)
+    separate_bands = tags.get(TAG_PLANAR_CONFIGURATION, [1])[0] == 2
+    formats = {gdal.GDT_Byte: 'B', gdal.GDT_UInt16: 'H', gdal.GDT_Int16: 'h', gdal.GDT_UInt32: 'I',
+               gdal.GDT_Int32: 'i', gdal.GDT_Float32: 'f', gdal.GDT_Float64: 'd'}
+
+    for index in block_indices:
+        band_numbers = [index // blocks_per_band + 1] if separate_bands else range(1, dataset.RasterCount + 1)
+        block = index % blocks_per_band
+        x, y = (block % blocks_across) * block_width, (block // blocks_across) * block_height
+        window_width, window_height = min(block_width, width - x), min(block_height, height - y)
+        for band_number in band_numbers:
+            band = dataset.GetRasterBand(band_number)
+            sample_format = formats.get(band.DataType)
+            if sample_format is None:
+                return False
+            nodata = band.GetNoDataValue() or 0
+            pattern = struct.pack('=' + sample_format, nodata if sample_format in 'fd' else int(nodata))
+            if band.ReadRaster(x, y, window_width, window_height) != pattern * (window_width * window_height):
+                return False
+    return True
+
+def is_empty_tif(file_path):
+    """
+    Check if a TIF only contains nodata, without decoding the whole image.
+    The sizes of the blocks (tiles or strips) are read from the TIFF header:
+    - blocks with byte count 0 are sparse (not written, nodata), if all are sparse the TIF is empty
+    - SAMPLE_BLOCKS blocks spread over the image are decoded first, the check stops at the first one with data
+    - blocks with identical compressed bytes have identical content, so only one block of each
+      different content is decoded; with more than MAX_DECODED_BLOCKS different blocks the TIF contains data
+    In case of doubt (compression not supported without GDAL) the TIF is considered not empty.
+    """
+    tags, byte_order = read_tiff_tags(file_path)
+    offsets = tags.get(TAG_TILE_OFFSETS, tags.get(TAG_STRIP_OFFSETS))
+    byte_counts = tags.get(TAG_TILE_BYTE_COUNTS, tags.get(TAG_STRIP_BYTE_COUNTS))
+    if not offsets or not byte_counts or len(offsets) != len(byte_counts):
+        return False
+    blocks = [(index, offset, byte_count) for index, (offset, byte_count) in enumerate(zip(offsets, byte_counts)) if byte_count > 0]
+    if not blocks:
+        return True
+    # Image content compresses to blocks of many different sizes
+    if len({byte_count for index, offset, byte_count in blocks}) > MAX_DECODED_BLOCKS:
+        return False
+
+    with open(file_path, 'rb') as f:
+        # Decode a few samples before reading all blocks, e.g. uncompressed blocks all have the same size
+        nodata_blocks = set()
+        positions = {position * (len(blocks) - 1) // (SAMPLE_BLOCKS - 1) for position in range(SAMPLE_BLOCKS)}
+        for index, offset, byte_count in (blocks[position] for position in sorted(positions)):
+            f.seek(offset)
+            data = f.read(byte_count)
+            decoded = decode_block(data, tags)
+            if decoded is None:
+                continue
+            if not block_is_nodata(decoded, tags, byte_order):
+                return False
+            nodata_blocks.add(hashlib.sha1(data).digest())
+
+        # All samples are nodata: compare the bytes of the blocks, stop as soon as there are too many different ones
+        different_blocks = {}
+        for index, offset, byte_count in blocks:
+            f.seek(offset)
+            data = f.read(byte_count)
+            digest = hashlib.sha1(data).digest()
+            if digest not in nodata_blocks:
+                different_blocks.setdefault(digest, (index, data))
+                if len(different_blocks) > MAX_DECODED_BLOCKS:
+                    return False
+
+    undecoded = []
+    for index, data in different_blocks.values():
+        decoded = decode_block(data, tags)
+        if decoded is None:
+            undecoded.append(index)
+        elif not block_is_nodata(decoded, tags, byte_order):
+            return False
+    if undecoded:
+        return bool(gdal_blocks_are_nodata(file_path, undecoded, tags))
+    return True
+
+def split_name(name):
+    """
+    Name of the TIF a file belongs to and the type of the file ('.tif' or a sidecar extension),
+    e.g. 'A.TIF.aux.xml' -> ('A', '.aux.xml'). The type is None for other files.
+    Only the extensions are compared in any case, the stem is kept as it is: on a case sensitive
+    file system 'x.tfw' does not belong to 'X.tif'.
+    """
+    lower_name = name.lower()
+    if lower_name.endswith('.tif'):
+        return name[:-4], '.tif'
+    for extension in SIDECAR_EXTENSIONS:
+        if lower_name.endswith(extension):
+            stem = name[:-len(extension)]
+            if stem.lower().endswith('.tif'):
+                stem = stem[:-4]
+            return stem, extension
+    return name, None
+
+def list_directory(directory):
+    """List one directory: TIFs as (path, size), sidecars as (stem, path) and the subdirectories."""
+    tifs, sidecars, subdirectories = [], [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+                continue
+            stem, file_type = split_name(entry.name)
+            if file_type == '.tif':
+                # The size comes with the directory listing on Windows, no extra request to the share
+                tifs.append((entry.path, entry.stat().st_size))
+            elif file_type is not None:
+                sidecars.append((stem, entry.path))
+    return tifs, sidecars, subdirectories
+
+def scan_folder(folder, recursive, executor):
+    """
+    Find the TIFs and their sidecars in a folder, with recursive=True also in all subfolders.
+    The directories of each level are listed at the same time in the threads of the executor.
+    Returns the TIFs sorted by path as (path, size) and the sidecars as dict (directory, stem) -> [paths].
+    """
+    tifs = []
+    sidecars = {}
+    directories = [folder]
+    while directories:
+        next_directories = []
+        for directory, (found_tifs, found_sidecars, subdirectories) in zip(directories, executor.map(list_directory, directories)):
+            tifs += found_tifs
+            for stem, path in found_sidecars:
+                sidecars.setdefault((directory, stem), []).append(path)
+            if recursive:
+                next_directories += subdirectories
+        directories = next_directories
+    return sorted(tifs), sidecars
+
+def check_tif(file_path):
+    """Status of a TIF: 'empty', 'data' or 'error' with the error message."""
+    try:
+        return ('empty' if is_empty_tif(file_path) else 'data'), None
+    except (OSError, ValueError, struct.error, zlib.error) as e:
+        return 'error', str(e)
+
+def check_folder(folder, recursive, workers):
+    """
+    Scan a folder and check all TIFs, workers TIFs at the same time.
+    Returns one record per TIF: path, size, status, error and the sidecars of the TIF.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        tifs, sidecars = scan_folder(folder, recursive, executor)
+        statuses = executor.map(check_tif, [path for path, size in tifs])
+        records = []
+        for (path, size), (status, error) in zip(tifs, statuses):
+            stem = split_name(os.path.basename(path))[0]
+            records.append({'path': path, 'size': size, 'status': status, 'error': error,
+                            'sidecars': sorted(sidecars.get((os.path.dirname(path), stem), []))})
+    return records
+
+def write_report(report_file, folder, records):
+    """Write the result of a dry run as JSON: summary and one record per TIF."""
+    summary = {status: sum(1 for record in records if record['status'] == status) for status in ('empty', 'data', 'error')}
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump({'folder': folder, 'dry_run': True, 'summary': summary, 'tifs': records}, f, indent=1)
+
+def execute_code(folder, Sumup, counter, recursive=False, workers=default_workers):
+    # Search for .tif files, check if they only contain nodata and delete them with their sidecars
     print("Ich suche .tif files in Ordner: ...")
-    tif_files = [f for f in os.listdir(folder) if f.lower().endswith('.tif')]
-    if tif_files:
-        print ("Es gibt "+str(len(tif_files))+" Tifs in Ordner")
+    records = check_folder(folder, recursive, workers)
+    if records:
+        print ("Es gibt "+str(len(records))+" Tifs in Ordner")
         print ("Ich\33[93m lösche\33[0m folgenden TIFs (und TFWs) für dich:")
-        for tif_file in tif_files:
-            # Get the full path of the file
-            file_path = os.path.join(folder, tif_file)
-            # Get the size of the file in bytes
-            file_size = os.path.getsize(file_path)
-            # Get the file name without extension
-            file_name_without_ext = os.path.splitext(tif_file)[0]
-            if file_size < size_threshold:
-                files_to_delete.append(file_name_without_ext)
-                # Delete the file
-                os.remove(file_path)
-                print(f" - {tif_file}: {file_size} bytes (deleted)")
+        for record in records:
+            tif_file = os.path.relpath(record['path'], folder)
+            if record['status'] == 'error':
+                print(f" - {tif_file}: nicht lesbar ({record['error']}), wird behalten")
+            elif record['status'] == 'empty':
+                # Delete the file and its sidecars
+                for file_path in [record['path']] + record['sidecars']:
+                    os.remove(file_path)
+                print(f" - {tif_file}: {record['size']} bytes (deleted)")
                 Sumup=Sumup+tif_file+"\n"
-        if files_to_delete:
-            delete_tfw(files_to_delete)
-            counter= counter +1
+                counter=1
             
     else:
         print("No .tif files found in the selected folder.")
     return (Sumup,counter)
 
 
+#Main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove TIFs which only contain nodata, together with their tfw, aux.xml and ovr files.")
+    parser.add_argument('folder', nargs='?', help="Folder with the TIFs, asked for if not given")
+    parser.add_argument('--recursive', action='store_true', help="Also search all subfolders")
+    parser.add_argument('--workers', type=int, default=default_workers,
+                        help=f"TIFs checked at the same time (default {default_workers})")
+    parser.add_argument('--dry-run', metavar='REPORT.json',
+                        help="Delete nothing, write the result for every TIF as JSON into REPORT.json")
+    args = parser.parse_args()
 
-def delete_tfw(file_names):
-    tfw_files = [f for f in os.listdir(folder) if f.lower().endswith('.tfw')]
-    if tfw_files:
-        for tfw_file in tfw_files:
-            # Get the full path of the file
-            file_path = os.path.join(folder, tfw_file)
-            file_name_without_ext = os.path.splitext(tfw_file)[0]
-            if file_name_without_ext in file_names:
-                os.remove(file_path)
+    #Ask/Set user parameter
+    folder=args.folder or input("\nGive folder Path:")
 
+    if args.dry_run:
+        records = check_folder(folder, args.recursive, args.workers)
+        write_report(args.dry_run, folder, records)
+        print(f"{sum(1 for record in records if record['status'] == 'empty')} von {len(records)} Tifs sind leer, nichts gelöscht. Report: {args.dry_run}")
+        exit()
 
-#Main
-print ("\nIch werde alle leere Tifs aus "+folder+" \33[91mentfernen\33[0m, du wirst es nicht spüren\n") 
-Sumup,counter=execute_code(Sumup,counter)
-if counter==0:
-    print ("\33[92mKein Tif gelöscht (die enthalten alle mindestens 1 Pixel Daten)\33[0m")
-else:
-    logopt=input("\nWollen eine Liste der gelöschten Files in Ordner ablegen? (geben Sie 1 für Ja):")
-    if logopt=="1":
-        logfile= open(folder+"/log.txt","w")
-        logfile.write(Sumup)
-        logfile.close
-        
+    Sumup = "Leeren TIFs:\n"
+    counter=0
+
+    print ("\nIch werde alle leere Tifs aus "+folder+" \33[91mentfernen\33[0m, du wirst es nicht spüren\n") 
+    Sumup,counter=execute_code(folder,Sumup,counter,args.recursive,args.workers)
+    if counter==0:
+        print ("\33[92mKein Tif gelöscht (die enthalten alle mindestens 1 Pixel Daten)\33[0m")
+    else:
+        logopt=input("\nWollen eine Liste der gelöschten Files in Ordner ablegen? (geben Sie 1 für Ja):")
+        if logopt=="1":
+            logfile= open(folder+"/log.txt","w")
+            logfile.write(Sumup)
+            logfile.close